@@ -1,7 +1,9 @@
 import logging
 
+from lib.metrics import metrics
 from lib.parsing import render
-from lib.utils import diff, dump, get_data, srdonly
+from lib.progress import progress
+from lib.utils import diff, dump, get_data, setup_logging, srdonly
 
 log = logging.getLogger("backgrounds")
 
@@ -53,10 +55,11 @@ def parse_traits(raw):
 
 def parse(data):
     out = []
-    for raw in data:
-        log.info(f"Parsing {raw['name']}...")
+    for raw in progress(data, "Parsing backgrounds"):
+        log.debug(f"Parsing {raw['name']}...")
         profs = parse_profs(raw)
-        traits = parse_traits(raw)
+        with metrics.timer('backgrounds.render', raw['name']):
+            traits = parse_traits(raw)
 
         background = {
             "name": raw['name'],
@@ -85,7 +88,9 @@ def run():
     dump(data, 'backgrounds.json')
     dump(srdonly(data), 'srd-backgrounds.json')
     diff('srd-backgrounds.json')
+    metrics.dump('backgrounds')
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()
@@ -0,0 +1,440 @@
+import json
+import logging
+import marshal
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import bestiary
+import classes
+import items
+import spells
+from bench import corpus, reference
+from lib import memo, parsing
+from lib.utils import setup_logging
+from lib.parsing import parse_data_formatting, recursive_tag, render
+
+BASELINE_PATH = os.environ.get("BENCH_BASELINE", "bench/baseline.json")
+THRESHOLD = float(os.environ.get("BENCH_THRESHOLD", 0.25))
+REPEAT = int(os.environ.get("BENCH_REPEAT", 3))
+
+log = logging.getLogger("bench")
+
+STAGES = {}
+GOLDEN = {}
+
+
+def stage(name):
+    """
+    Registers a benchmark stage.
+    The decorated function takes a Corpus and returns a zero-argument callable that runs the timed work. It is called
+    again before every repetition, so that stages which mutate their input always start from fresh data.
+    """
+
+    def decorator(func):
+        STAGES[name] = func
+        return func
+
+    return decorator
+
+
+def golden(name):
+    """
+    Registers a golden check: the decorated function takes a Corpus and returns a list of (input, expected, actual)
+    mismatches between the current code and its reference implementation.
+    """
+
+    def decorator(func):
+        GOLDEN[name] = func
+        return func
+
+    return decorator
+
+
+class Corpus:
+    def __init__(self, scale):
+        self.scale = scale
+        spells = corpus.spells(scale)
+        # stored marshalled, so that every repetition can cheaply get its own untouched copy
+        self._data = {
+            'monsters': marshal.dumps(corpus.monsters(scale)),
+            'spells': marshal.dumps(spells),
+            'automation': marshal.dumps(corpus.spell_automation(spells)),
+            'items': marshal.dumps(corpus.items(scale)),
+            'objects': marshal.dumps(corpus.objects(scale)),
+            'classes': marshal.dumps(corpus.classes(scale)),
+            'hostile': marshal.dumps(corpus.hostile_monsters(scale))
+        }
+
+    def __getattr__(self, item):
+        try:
+            return marshal.loads(self._data[item])
+        except KeyError:
+            raise AttributeError(item)
+
+
+def _texts(c):
+    """Every entry list of the corpus that render() would see."""
+    out = []
+    for monster in c.monsters:
+        for t in ('trait', 'action', 'reaction', 'legendary'):
+            out.extend(entry['entries'] for entry in monster.get(t, []))
+    out.extend(spell['entries'] for spell in c.spells)
+    out.extend(item['entries'] for item in c.items)
+    for _class in c.classes:
+        out.extend(feature['entries'] for level in _class['classFeatures'] for feature in level)
+    return out
+
+
+def _strings(value, out):
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, list):
+        for v in value:
+            _strings(v, out)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _strings(v, out)
+    return out
+
+
+@stage('render')
+def bench_render(c):
+    texts = _texts(c)
+    return lambda: [render(t) for t in texts]
+
+
+@stage('render.reference')
+def bench_render_reference(c):
+    texts = _texts(c)
+    return lambda: [reference.render(t) for t in texts]
+
+
+@golden('render')
+def golden_render(c):
+    mismatches = []
+    for t in _texts(c):
+        expected = reference.render(t)
+        actual = render(t)
+        if expected != actual:
+            mismatches.append((t, expected, actual))
+    return mismatches
+
+
+# the render memo is off unless asked for (see lib.memo); render.warm turns it on, in memory, for itself only
+WARM_RENDER_CACHE = parsing.RENDER_CACHE or memo.MemoCache('render', parsing.VERSION)
+
+
+@contextmanager
+def render_memo():
+    saved = parsing.RENDER_CACHE
+    parsing.RENDER_CACHE = WARM_RENDER_CACHE
+    try:
+        yield
+    finally:
+        parsing.RENDER_CACHE = saved
+
+
+@stage('render.warm')
+def bench_render_warm(c):
+    """render with the memo on, after every text was rendered once, as if met again, e.g. through _copy."""
+    texts = _texts(c)
+    with render_memo():
+        [render(t) for t in texts]
+
+    def run():
+        with render_memo():
+            return [render(t) for t in texts]
+
+    return run
+
+
+@stage('parse_data_formatting')
+def bench_parse_data_formatting(c):
+    strings = _strings(_texts(c), [])
+    return lambda: [parse_data_formatting(s) for s in strings]
+
+
+@stage('parse_data_formatting.reference')
+def bench_parse_data_formatting_reference(c):
+    strings = _strings(_texts(c), [])
+    return lambda: [reference.parse_data_formatting(s) for s in strings]
+
+
+@golden('parse_data_formatting')
+def golden_parse_data_formatting(c):
+    mismatches = []
+    for s in _strings(_texts(c), []):
+        expected = reference.parse_data_formatting(s)
+        actual = parse_data_formatting(s)
+        if expected != actual:
+            mismatches.append((s, expected, actual))
+    return mismatches
+
+
+@stage('recursive_tag')
+def bench_recursive_tag(c):
+    data = c.classes
+    return lambda: recursive_tag(data)
+
+
+@stage('bestiary.parse_copies')
+def bench_parse_copies(c):
+    data = c.monsters
+    return lambda: bestiary.parse_copies(data)
+
+
+@stage('bestiary.parse_copies.reference')
+def bench_parse_copies_reference(c):
+    data = c.monsters
+    return lambda: reference.parse_copies(data)
+
+
+@golden('bestiary.parse_copies')
+def golden_parse_copies(c):
+    expected = reference.parse_copies(c.monsters)
+    actual = bestiary.parse_copies(c.monsters)
+    return [(e.get('name'), e, a) for e, a in zip(expected, actual) if e != a] + \
+        ([('(length)', len(expected), len(actual))] if len(expected) != len(actual) else [])
+
+
+@stage('bestiary.srdfilter')
+def bench_bestiary_srdfilter(c):
+    data = c.monsters
+    return lambda: bestiary.srdfilter(data)
+
+
+def _rendered_monsters(c):
+    data = bestiary.parse_copies(c.monsters)
+    return recursive_tag(bestiary.monster_render(data))
+
+
+@stage('bestiary.parse_attacks')
+def bench_parse_attacks(c):
+    data = _rendered_monsters(c)
+    return lambda: bestiary.parse_attacks(data)
+
+
+@stage('bestiary.parse_attacks.reference')
+def bench_parse_attacks_reference(c):
+    data = _rendered_monsters(c)
+    return lambda: reference.parse_attacks(data)
+
+
+@stage('bestiary.parse_attacks.hostile')
+def bench_parse_attacks_hostile(c):
+    data = c.hostile
+    return lambda: bestiary.parse_attacks(data)
+
+
+@stage('bestiary.parse_attacks.hostile.reference')
+def bench_parse_attacks_hostile_reference(c):
+    data = c.hostile
+    return lambda: reference.parse_attacks(data)
+
+
+@golden('bestiary.parse_attacks')
+def golden_parse_attacks(c):
+    data = _rendered_monsters(c) + c.hostile
+    expected = reference.parse_attacks(marshal.loads(marshal.dumps(data)))
+    actual = bestiary.parse_attacks(data)
+    return [(e['name'], e['attacks'], a['attacks']) for e, a in zip(expected, actual) if e != a]
+
+
+@stage('bestiary.run')
+def bench_bestiary_run(c):
+    data = c.monsters
+
+    def run():
+        out = bestiary.parse_copies(data)
+        out = bestiary.srdfilter(out)
+        out = bestiary.parse_ac(out)
+        out = bestiary.translate_skills(out)
+        out = bestiary.monster_render(out)
+        out = recursive_tag(out)
+        return bestiary.parse_attacks(out)
+
+    return run
+
+
+@stage('bestiary.run.fused')
+def bench_bestiary_run_fused(c):
+    data = c.monsters
+
+    def run():
+        out = bestiary.parse_copies(data)
+        out = bestiary.srdfilter(out)
+        return bestiary.transform(out)
+
+    return run
+
+
+@stage('bestiary.run.parallel')
+def bench_bestiary_run_parallel(c):
+    data = c.monsters
+
+    def run():
+        out = bestiary.parse_copies(data)
+        out = bestiary.srdfilter(out)
+        return bestiary.transform_parallel(out)
+
+    return run
+
+
+@stage('bestiary.run.incremental')
+def bench_bestiary_run_incremental(c):
+    """A rebuild after nothing changed: the store is filled before timing."""
+    store = os.path.join(tempfile.mkdtemp(), 'bestiary-store.bin')
+    bestiary.build_incremental(c.monsters, store)
+    data = c.monsters
+    return lambda: bestiary.build_incremental(data, store)
+
+
+@stage('items.srdfilter')
+def bench_items_srdfilter(c):
+    data = c.items
+    return lambda: items.srdfilter(data)
+
+
+@stage('items.run')
+def bench_items_run(c):
+    data, objects = c.items, c.objects
+
+    def run():
+        out = items.moneyfilter(data)
+        out = items.variant_inheritance(out)
+        out.extend(items.object_actions(objects))
+        out = items.srdfilter(out)
+        out = items.prerender(out)
+        return items.site_render(out)
+
+    return run
+
+
+@stage('classes.run')
+def bench_classes_run(c):
+    data = c.classes
+
+    def run():
+        out = classes.filter_ignored(data)
+        out = classes.srdfilter(out)
+        out = recursive_tag(out)
+        out = classes.fix_subclass_dupes(out)
+        return classes.parse_classfeats(out)
+
+    return run
+
+
+@stage('spells.run')
+def bench_spells_run(c):
+    spells.set_auto_spells(c.automation)
+    data = c.spells
+
+    def run():
+        out = spells.parse(data)
+        return spells.srdfilter(out)
+
+    return run
+
+
+def measure(setup, c):
+    best = None
+    for _ in range(REPEAT):
+        memo.clear_all(disk=False)  # every repetition starts cold, as a fresh run would
+        func = setup(c)
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(scales, names):
+    """:returns tuple - The best time of each stage that ran, and the keys of those that raised instead."""
+    results, failures = {}, []
+    for scale in scales:
+        log.info(f"Generating {scale}x corpus...")
+        c = Corpus(scale)
+        for name in names:
+            key = f"{name}@{scale}x"
+            try:
+                results[key] = measure(STAGES[name], c)
+            except Exception:
+                log.exception(f"{key:<36} failed")
+                failures.append(key)
+                continue
+            log.info(f"{key:<36} {results[key]:9.4f}s")
+    return results, failures
+
+
+def compare(results, baseline):
+    regressions = []
+    for key, elapsed in results.items():
+        if key not in baseline:
+            continue
+        change = elapsed / baseline[key] - 1
+        if change > THRESHOLD:
+            regressions.append(key)
+            log.error(f"{key:<36} {baseline[key]:9.4f}s -> {elapsed:9.4f}s ({change:+.0%})")
+    return regressions
+
+
+def check_golden(scales, names):
+    failed = False
+    for scale in scales:
+        c = Corpus(scale)
+        for name in names:
+            mismatches = GOLDEN[name](c)
+            for given, expected, actual in mismatches[:10]:
+                log.error(f"{name}: {given!r}\n  expected {expected!r}\n  got      {actual!r}")
+            log.info(f"{name + '@' + str(scale) + 'x':<36} {len(mismatches)} mismatches")
+            failed = failed or bool(mismatches)
+    return failed
+
+
+def run():
+    scales = [int(a) for a in sys.argv[1:] if a.isdigit()] or [1]
+    if "golden" in sys.argv:
+        names = [a for a in sys.argv[1:] if a in GOLDEN] or list(GOLDEN)
+        if check_golden(scales, names):
+            sys.exit(1)
+        return
+
+    names = [a for a in sys.argv[1:] if a in STAGES] or list(STAGES)
+    results, failures = run_benchmarks(scales, names)
+    if failures:
+        log.error(f"{len(failures)} stages failed: {', '.join(failures)}")
+
+    regressions = []
+    if "save" in sys.argv:
+        try:
+            with open(BASELINE_PATH) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            baseline = {}
+        baseline.update(results)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        log.info(f"Saved {len(results)} results to {BASELINE_PATH}")
+    else:
+        try:
+            with open(BASELINE_PATH) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            log.info(f"No baseline at {BASELINE_PATH}; run with 'save' to record one")
+        else:
+            regressions = compare(results, baseline)
+            if not regressions:
+                log.info(f"No regressions beyond {THRESHOLD:.0%}")
+    if regressions or failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    setup_logging()
+    # only the benchmark results should show, not the pipelines' own progress
+    logging.getLogger().setLevel(logging.DEBUG if "debug" in sys.argv else logging.ERROR)
+    log.setLevel(logging.INFO)
+    run()
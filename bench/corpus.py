@@ -0,0 +1,240 @@
+"""
+Seeded generators for synthetic data shaped like the 5etools monster, spell, item and class files.
+Scale 1 is roughly the size of the real data; the same seed and scale always give the same corpus.
+"""
+import random
+
+MONSTERS = 2000
+SPELLS = 500
+ITEMS = 1300
+CLASSES = 13
+
+WORDS = ('goblin', 'ancient', 'shadow', 'dragon', 'knight', 'swarm', 'frost', 'giant', 'lich', 'hound', 'spirit',
+         'warden', 'iron', 'blood', 'storm', 'hag', 'ooze', 'cult', 'fanatic', 'elemental', 'wyrm', 'golem')
+SOURCES = ('MM', 'VGM', 'MTF', 'XGE', 'PHB', 'DMG', 'GGR', 'TftYP', 'ToA', 'UAWGtE')
+DAMAGE = ('slashing', 'piercing', 'bludgeoning', 'fire', 'cold', 'necrotic', 'radiant', 'poison', 'psychic')
+CONDITIONS = ('blinded', 'charmed', 'frightened', 'grappled', 'paralyzed', 'poisoned', 'prone', 'restrained')
+SPELL_NAMES = ('fireball', 'mage hand', 'shield', 'misty step', 'counterspell', 'hold person', 'fly', 'light',
+               'cure wounds', 'bless', 'detect magic', 'dispel magic', 'invisibility', 'lightning bolt')
+CRS = ('0', '1/8', '1/4', '1/2', '1', '2', '3', '5', '8', '11', '13', '17', '21', '24')
+SCHOOLS = ('A', 'C', 'D', 'E', 'V', 'I', 'N', 'T')
+CLASS_NAMES = ('Barbarian', 'Bard', 'Cleric', 'Druid', 'Fighter', 'Monk', 'Paladin', 'Ranger', 'Rogue', 'Sorcerer',
+               'Warlock', 'Wizard', 'Artificer')
+ITEM_TYPES = ('M', 'R', 'LA', 'MA', 'HA', 'S', 'W', 'P', 'RG', 'WD', 'G', 'SCF', '$')
+
+
+def _srd_names(path):
+    with open(path) as f:
+        return [line.split(':')[0].strip() for line in f.read().split('\n') if line.strip() and '*' not in line]
+
+
+def _name(rng, i):
+    return f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}"
+
+
+def _sentence(rng, tags=True):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    if tags:
+        for _ in range(rng.randint(0, 3)):
+            tag = rng.choice((f"{{@condition {rng.choice(CONDITIONS)}}}", f"{{@spell {rng.choice(SPELL_NAMES)}}}",
+                              f"{{@dice {rng.randint(1, 8)}d{rng.choice((4, 6, 8, 10))}}}",
+                              f"{{@damage {rng.randint(1, 4)}d6}}", f"{{@item longsword|phb}}",
+                              f"{{@b {{@i {rng.choice(WORDS)}}}}}", f"{{@creature {rng.choice(WORDS)}|mm|one}}",
+                              f"{{@dc {rng.randint(10, 20)}}}", f"{{@skill Perception}}"))
+            words.insert(rng.randrange(len(words) + 1), tag)
+    return ' '.join(words).capitalize() + '.'
+
+
+def _entries(rng, depth=0):
+    entries = [_sentence(rng) for _ in range(rng.randint(1, 3))]
+    roll = rng.random()
+    if depth < 2 and roll < 0.15:
+        entries.append({'type': 'entries', 'name': rng.choice(WORDS).title(), 'entries': _entries(rng, depth + 1)})
+    elif roll < 0.25:
+        entries.append({'type': 'list', 'items': [_sentence(rng) for _ in range(rng.randint(2, 5))]})
+    elif roll < 0.3:
+        entries.append({'type': 'table', 'caption': rng.choice(WORDS).title(), 'colLabels': ['d6', 'Effect'],
+                        'rows': [[{'type': 'cell', 'roll': {'exact': i}}, _sentence(rng)] for i in range(1, 7)]})
+    return entries
+
+
+def _attack(rng):
+    hit = rng.randint(2, 12)
+    dmg = f"{rng.randint(1, 4)}d{rng.choice((4, 6, 8, 10, 12))} + {rng.randint(0, 6)}"
+    text = (f"{{@atk {rng.choice(('mw', 'rw', 'mw,rw'))}}} {{@hit {hit}}} to hit, reach 5 ft., one target. "
+            f"{{@h}}{rng.randint(3, 40)} ({{@damage {dmg}}}) {rng.choice(DAMAGE)} damage")
+    roll = rng.random()
+    if roll < 0.2:
+        text += f", or {rng.randint(3, 40)} ({{@damage {dmg}}}) {rng.choice(DAMAGE)} damage if used with two hands."
+    elif roll < 0.4:
+        text += f" plus {rng.randint(3, 20)} ({{@damage {rng.randint(1, 4)}d6}}) {rng.choice(DAMAGE)} damage."
+    else:
+        text += '.'
+    return text
+
+
+def _abilities(rng, key):
+    return [{'name': rng.choice(WORDS).title(), 'entries': [_attack(rng) if key == 'action' and rng.random() < 0.6
+                                                             else _sentence(rng)]}
+            for _ in range(rng.randint(1, 4))]
+
+
+def _spellcasting(rng):
+    level = rng.randint(1, 20)
+    return [{
+        'name': 'Spellcasting',
+        'headerEntries': [f"The creature is a {level}th-level spellcaster. Its spellcasting ability is Intelligence "
+                          f"(spell save DC {rng.randint(10, 19)}, {{@hit {rng.randint(2, 11)}}} to hit with spell "
+                          f"attacks). It has the following wizard spells prepared:"],
+        'will': [f"{{@spell {rng.choice(SPELL_NAMES)}}}"],
+        'daily': {'1e': [f"{{@spell {s}}}" for s in rng.sample(SPELL_NAMES, 2)]},
+        'spells': {str(lvl): {'slots': rng.randint(1, 4), 'spells': [f"{{@spell {s}}}" for s in rng.sample(SPELL_NAMES, 3)]}
+                   for lvl in range(0, rng.randint(1, 6))}
+    }]
+
+
+def monsters(scale=1, seed=0):
+    rng = random.Random(seed)
+    srd = _srd_names('srd/srd-monsters.txt')
+    out = []
+    for i in range(MONSTERS * scale):
+        name = rng.choice(srd) if rng.random() < 0.3 else _name(rng, i)
+        source = rng.choice(SOURCES)
+        if out and rng.random() < 0.08:
+            target = rng.choice(out[max(0, len(out) - 200):])
+            word = rng.choice(WORDS)
+            out.append({
+                'name': _name(rng, i), 'source': source,
+                '_copy': {'name': target['name'], 'source': target['source'],
+                          'replacers': [{'replace': word, 'with': f"{word} lord"}],
+                          'arrayModifiers': {'action': [{'mode': 'append', 'data': _abilities(rng, 'action')}]}}
+            })
+            continue
+        monster = {
+            'name': name, 'source': source, 'page': rng.randint(1, 350), 'size': rng.choice('TSMLHG'),
+            'type': rng.choice(WORDS), 'alignment': ['C', 'E'], 'cr': rng.choice(CRS),
+            'ac': [rng.randint(10, 22)] if rng.random() < 0.5 else
+            [{'ac': rng.randint(10, 22), 'from': ['{@item leather armor|phb}', '{@item shield|phb}']}],
+            'hp': {'average': rng.randint(1, 400), 'formula': f"{rng.randint(1, 30)}d8"},
+            'speed': {'walk': 30}, 'str': rng.randint(1, 30), 'dex': rng.randint(1, 30), 'con': rng.randint(1, 30),
+            'int': rng.randint(1, 30), 'wis': rng.randint(1, 30), 'cha': rng.randint(1, 30),
+            'save': {'dex': f"+{rng.randint(1, 9)}", 'wis': f"+{rng.randint(1, 9)}"},
+            'skill': {'perception': f"+{rng.randint(1, 9)}", 'stealth': f"+{rng.randint(1, 9)}"},
+            'trait': _abilities(rng, 'trait'), 'action': _abilities(rng, 'action')
+        }
+        if rng.random() < 0.2:
+            monster['reaction'] = _abilities(rng, 'reaction')
+        if rng.random() < 0.1:
+            monster['legendary'] = _abilities(rng, 'legendary')
+        if rng.random() < 0.1:
+            monster['spellcasting'] = _spellcasting(rng)
+        out.append(monster)
+    return out
+
+
+def spells(scale=1, seed=0):
+    rng = random.Random(seed)
+    srd = _srd_names('srd/srd-spells.txt')
+    out = []
+    for i in range(SPELLS * scale):
+        spell = {
+            'name': rng.choice(srd) if rng.random() < 0.5 else _name(rng, i), 'source': rng.choice(SOURCES),
+            'page': rng.randint(1, 300), 'level': rng.randint(0, 9), 'school': rng.choice(SCHOOLS),
+            'time': [{'number': 1, 'unit': rng.choice(('action', 'bonus', 'reaction', 'minute'))}],
+            'range': {'type': 'point', 'distance': {'type': 'feet', 'amount': rng.choice((5, 30, 60, 120))}},
+            'components': {'v': True, 's': rng.random() < 0.8, 'm': 'a pinch of sulfur'},
+            'duration': [{'type': 'timed', 'duration': {'type': 'minute', 'amount': rng.choice((1, 10))},
+                          'concentration': rng.random() < 0.4}],
+            'classes': {'fromClassList': [{'name': c} for c in rng.sample(CLASS_NAMES, 3)],
+                        'fromSubclass': [{'class': {'name': 'Cleric'}, 'subclass': {'name': 'Light'}}]},
+            'entries': _entries(rng),
+            'meta': {'ritual': rng.random() < 0.1}
+        }
+        if rng.random() < 0.3:
+            spell['entriesHigherLevel'] = [{'type': 'entries', 'name': 'At Higher Levels',
+                                            'entries': [_sentence(rng)]}]
+        out.append(spell)
+    return out
+
+
+def spell_automation(spells, seed=0):
+    """:returns list - Automation for most of the spells, as avrae-spells lays it out, and some for no spell at all."""
+    rng = random.Random(seed)
+    names = list(dict.fromkeys(spell['name'] for spell in spells))
+    out = [{'name': name, 'automation': [{'type': 'target', 'target': 'each',
+                                          'effects': [{'type': 'damage', 'damage': f"{rng.randint(1, 8)}d6"}]}]}
+           for name in names if rng.random() < 0.8]
+    out.extend({'name': f"Orphan {i}", 'automation': []} for i in range(len(names) // 20))
+    rng.shuffle(out)
+    return out
+
+
+def items(scale=1, seed=0):
+    rng = random.Random(seed)
+    srd = _srd_names('srd/srd-items.txt')
+    out = []
+    for i in range(ITEMS * scale):
+        type_ = rng.choice(ITEM_TYPES)
+        item = {'name': rng.choice(srd) if rng.random() < 0.3 else _name(rng, i),
+                'source': rng.choice(('PHB', 'DMG', 'XGE')), 'type': type_, 'rarity': rng.choice(('common', 'rare')),
+                'weight': str(rng.randint(1, 20)), 'entries': _entries(rng)}
+        if type_ in ('M', 'R'):
+            item.update({'dmg1': '1d8', 'dmgType': rng.choice('BPS'), 'weaponCategory': 'Martial',
+                         'property': ['V', 'F'], 'dmg2': '1d10'})
+        if type_ in ('LA', 'MA', 'HA', 'S'):
+            item['ac'] = rng.randint(1, 18)
+        if rng.random() < 0.05:
+            item.update({'type': 'GV', 'inherits': {'namePrefix': '+1 ', 'rarity': 'uncommon',
+                                                    'entries': ['You have a {=bonusWeapon} bonus.'],
+                                                    'bonusWeapon': '+1'}})
+        out.append(item)
+    return out
+
+
+def objects(scale=1, seed=0):
+    rng = random.Random(seed)
+    return [{'name': _name(rng, i), 'source': 'DMG', 'entries': _entries(rng),
+             'actionEntries': [{'type': 'actions', 'name': 'Fire', 'entries': [_sentence(rng)]}]}
+            for i in range(20 * scale)]
+
+
+def classes(scale=1, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for i in range(CLASSES * scale):
+        features = []
+        for level in range(20):
+            entries = _entries(rng)
+            if rng.random() < 0.1:
+                entries.append({'type': 'options', 'entries': [
+                    {'type': 'entries', 'name': rng.choice(WORDS).title(), 'entries': [_sentence(rng)]}
+                    for _ in range(3)]})
+            features.append([{'name': f"{rng.choice(WORDS).title()} {level}", 'entries': entries}])
+        subclasses = [{
+            'name': f"{rng.choice(WORDS).title()} Path {j}", 'source': rng.choice(SOURCES),
+            'subclassFeatures': [[{'name': f"Feature {level}", 'entries': [
+                {'type': 'entries', 'name': f"{rng.choice(WORDS).title()} {level}", 'entries': _entries(rng)}]}]
+                for level in range(4)]
+        } for j in range(rng.randint(3, 8))]
+        out.append({'name': CLASS_NAMES[i % len(CLASS_NAMES)] if i < len(CLASS_NAMES) else _name(rng, i),
+                    'source': 'PHB', 'classFeatures': features, 'subclasses': subclasses})
+    return out
+
+
+def hostile_monsters(scale=1):
+    """
+    Monsters, already rendered, whose lines almost hold an attack over and over, as a long legendary or lair text can.
+    A backtracking parser takes time polynomial in the length of such a line; these are kept short enough that the
+    reference implementation still finishes.
+    """
+    n = 40 * scale
+    texts = {
+        'Attacks': "Melee Weapon Attack: +5 to hit, reach 5 ft., one target. " * n,
+        'Hits': "Melee Weapon Attack: +5 to hit, " * n + "Hit: 5 (1d6 + 2 " * n,
+        'Dice': "Hit: 5 (1d6 + 2 " * n + "5 (1d6) piercing damage.",
+        'Versatile': "Melee Weapon Attack: +5 to hit, Hit: 5 (1d6) fire damage or 7 (1d8) fire damage " + "word " * n,
+        'Mixed': "Ranged Weapon Attack: +7 to hit, range 80/320 ft. Hit: 7 (1d8 + 3) piercing damage plus 3 (1d6) "
+                 "fire damage. " * n
+    }
+    return [{'name': name, 'source': 'MM', 'legendary': [{'name': name, 'text': text}]}
+            for name, text in texts.items()]
@@ -0,0 +1,223 @@
+"""
+Earlier implementations kept as references: benchmarks time the current code against them, and the golden checks
+assert that both give the same output.
+"""
+import json
+import logging
+import re
+
+from lib.parsing import ABILITY_MAP, ATTACK_TYPES, DEFAULT, FORMATTING, PARSING, SRC_FORMAT
+
+log = logging.getLogger("lib.parsing")  # logs what lib.parsing used to
+bestiary_log = logging.getLogger("bestiary")
+
+ATTACK_RE = re.compile(r'(?:<i>)?(?:\w+ ){1,4}Attack:(?:</i>)? ([+-]?\d+) to hit, .*?(?:<i>)?'
+                       r'Hit:(?:</i>)? (?:(?:[+-]?\d+ \((.+?)\))|(?:([+-]?\d+))) (\w+) damage[., ]??'
+                       r'(?:in melee, or [+-]?\d+ \((.+?)\) (\w+) damage at range[,.]?)?'
+                       r'(?: or [+-]?\d+ \((.+?)\) (\w+) damage (?:\w+ ?)+[.,]?)?'
+                       r'(?: ?plus [+-]?\d+ \((.+?)\) (\w+) damage)?', re.IGNORECASE)
+JUST_DAMAGE_RE = re.compile(r'[+-]?\d+ \((.+?)\) (\w+) damage', re.IGNORECASE)
+
+
+def render(text, md_breaks=False, join_char='\n'):
+    """The if/elif chain over entry types, which parsed the text again at every level of nesting."""
+    if isinstance(text, dict):
+        text = [text]
+    if not isinstance(text, list):
+        return parse_data_formatting(str(text))
+
+    out = []
+    join_str = f'{join_char}' if not md_breaks else f'  {join_char}'
+
+    for entry in text:
+        if not isinstance(entry, dict):
+            out.append(str(entry))
+        elif isinstance(entry, dict):
+            if 'type' not in entry and 'title' in entry:
+                out.append(f"**{entry['title']}**: {render(entry['text'])}")
+            elif 'type' not in entry and 'istable' in entry:  # only for races
+                temp = f"**{entry['caption']}**\n" if 'caption' in entry else ''
+                temp += ' - '.join(f"**{parse_data_formatting(cl)}**" for cl in entry['thead']) + '\n'
+                for row in entry['tbody']:
+                    temp += ' - '.join(f"{parse_data_formatting(col)}" for col in row) + '\n'
+                out.append(temp.strip())
+            elif 'type' not in entry or entry['type'] in ('entries', 'inset'):
+                out.append((f"**{entry['name']}**: " if 'name' in entry else '') + render(
+                    entry['entries']))  # oh gods here we goooooooo
+            elif entry['type'] == 'options':
+                pass  # parsed separately in classfeat
+            elif entry['type'] == 'list':
+                out.append('\n'.join(f"- {render(t)}" for t in entry['items']))
+            elif entry['type'] == 'table':
+                temp = f"**{entry['caption']}**\n" if 'caption' in entry else ''
+                temp += ' - '.join(f"**{parse_data_formatting(cl)}**" for cl in entry['colLabels']) + '\n'
+                for row in entry['rows']:
+                    temp += ' - '.join(f"{render(col)}" for col in row) + '\n'
+                out.append(temp.strip())
+            elif entry['type'] == 'invocation':
+                pass  # this is only found in options
+            elif entry['type'] == 'abilityAttackMod':
+                out.append(f"`{entry['name']} Attack Bonus = "
+                           f"{' or '.join(ABILITY_MAP.get(a) for a in entry['attributes'])}"
+                           f" modifier + Proficiency Bonus`")
+            elif entry['type'] == 'abilityDc':
+                out.append(f"`{entry['name']} Save DC = 8 + "
+                           f"{' or '.join(ABILITY_MAP.get(a) for a in entry['attributes'])}"
+                           f" modifier + Proficiency Bonus`")
+            elif entry['type'] == 'bonus':
+                out.append("{:+}".format(entry['value']))
+            elif entry['type'] == 'dice':
+                out.append(f"{entry['number']}d{entry['faces']}")
+            elif entry['type'] == 'bonusSpeed':
+                out.append(f"{entry['value']} feet")
+            elif entry['type'] == 'actions':
+                out.append((f"**{entry['name']}**: " if 'name' in entry else '') + render(entry['entries']))
+            elif entry['type'] == 'attack':
+                out.append(f"{' '.join(ATTACK_TYPES.get(t) for t in entry['attackType'])} Attack: "
+                           f"{render(entry['attackEntries'])} Hit: {render(entry['hitEntries'])}")
+            elif entry['type'] == 'item':
+                out.append(f"*{entry['name']}* {render(entry['entry'])}")
+            elif entry['type'] == 'cell':
+                if 'entry' in entry:
+                    out.append(render(entry['entry']))
+                else:
+                    if 'exact' in entry['roll']:
+                        out.append(str(entry['roll']['exact']))
+                    else:
+                        out.append(f"{str(entry['roll']['min'])} - {str(entry['roll']['max'])}")
+            else:
+                log.warning(f"Missing data entry type parse: {entry}")
+
+        else:
+            log.warning(f"Unknown data entry: {entry}")
+
+    return parse_data_formatting(join_str.join(out))
+
+
+def parse_data_formatting(text):
+    """The regex implementation, which rescans the whole text once per level of tag nesting."""
+    exp = re.compile(r'{@(\w+)(?: ([^{}]+?))?}')
+
+    def sub(match):
+        log.debug(f"Rendering {match.group(0)}...")
+        if match.group(1) in FORMATTING:
+            f = FORMATTING.get(match.group(1), '')
+            out = f"{f}{match.group(2)}{f}"
+        elif match.group(1) in PARSING:
+            f = PARSING.get(match.group(1), lambda e: e)
+            out = f(match.group(2))
+        else:
+            out = SRC_FORMAT(match.group(2))
+            if not match.group(1) in DEFAULT:
+                log.warning(f"Possible unknown tag: {match.group(0)}")
+        log.debug(f"Replaced with {out}")
+        return out
+
+    while exp.search(text):
+        text = exp.sub(sub, text)
+    return text
+
+
+def parse_copies(data):
+    """Resolved each _copy against the list as it stood, re-serializing the copied monster to apply its replacers."""
+    for i, monster in enumerate(data):
+        if '_copy' not in monster:
+            continue
+        original = monster.copy()  # how ironic
+        del original['_copy']
+
+        copymeta = monster['_copy']
+        bestiary_log.debug(f"Copying {copymeta['name']} onto {monster['name']}...")
+        to_copy = next(m for m in data if m['source'] == copymeta['source'] and m['name'] == copymeta['name'])
+
+        # I hate this so much
+        data_str = json.dumps(to_copy)
+        for replacer in copymeta.get('replacers', []):
+            data_str = data_str.replace(replacer['replace'], replacer['with'])
+        copied = json.loads(data_str)
+
+        for key, mod in copymeta.get('arrayModifiers', {}).items():
+            for action in mod:
+                if action['mode'] == 'replace':
+                    for entry in action['data']:
+                        to_replace = next(e for e in copied[key] if e['name'] == entry['replace'])
+                        entry.pop('replace')
+                        to_replace.update(entry)
+                elif action['mode'] == 'remove':
+                    if 'data' not in action:
+                        try:
+                            del copied[key]
+                        except KeyError:
+                            bestiary_log.warning(f"I tried to delete key {key} but it does not exist")
+                            continue
+                    else:
+                        for to_remove in action['data']:
+                            try:
+                                copied[key].remove(next(e for e in copied[key] if e['name'] == to_remove['remove']))
+                            except StopIteration:
+                                bestiary_log.warning(f"I tried to remove {key}.{to_remove['remove']} but it does not exist")
+                                continue
+                elif action['mode'] == 'prepend':
+                    for entry in reversed(action['data']):
+                        copied[key].insert(0, entry)
+                elif action['mode'] == 'append':
+                    copied[key].extend(action['data'])
+                else:
+                    bestiary_log.warning(f"Unknown copy action: {action['mode']}")
+
+        copied.update(original)
+        data[i] = copied
+    return data
+
+
+def parse_attacks(data):
+    """Ran both regexes over every entry; ATTACK_RE backtracks badly on long lines that almost hold an attack."""
+    for monster in data:
+        attacks = []
+        for t in ('trait', 'action', 'reaction', 'legendary'):
+            if t in monster:
+                for entry in monster[t]:
+                    name = entry['name']
+                    raw = entry['text']
+                    raw_atks = list(ATTACK_RE.finditer(raw))
+                    raw_damage = list(JUST_DAMAGE_RE.finditer(raw))
+
+                    if raw_atks:
+                        for atk in raw_atks:
+                            if atk.group(7) and atk.group(8):  # versatile
+                                damage = f"{atk.group(7)}[{atk.group(8)}]"
+                                if atk.group(9) and atk.group(10):  # bonus damage
+                                    damage += f"+{atk.group(9)}[{atk.group(10)}]"
+                                attacks.append(
+                                    {'name': f"2 Handed {name}", 'attackBonus': atk.group(1).lstrip('+'),
+                                     'damage': damage,
+                                     'details': raw})
+                            if atk.group(5) and atk.group(6):  # ranged
+                                damage = f"{atk.group(5)}[{atk.group(6)}]"
+                                if atk.group(9) and atk.group(10):  # bonus damage
+                                    damage += f"+{atk.group(9)}[{atk.group(10)}]"
+                                attacks.append(
+                                    {'name': f"Ranged {name}", 'attackBonus': atk.group(1).lstrip('+'),
+                                     'damage': damage,
+                                     'details': raw})
+                            damage = f"{atk.group(2) or atk.group(3)}[{atk.group(4)}]"
+                            if atk.group(9) and atk.group(10):  # bonus damage
+                                damage += f"+{atk.group(9)}[{atk.group(10)}]"
+                            attacks.append(
+                                {'name': name, 'attackBonus': atk.group(1).lstrip('+'), 'damage': damage,
+                                 'details': raw})
+                    else:
+                        index = 1
+                        for dmg in raw_damage:
+                            damage = f"{dmg.group(1)}[{dmg.group(2)}]"
+                            if index > 1:
+                                name = f"{name} {index}"
+                            atk = {'name': name, 'attackBonus': None, 'damage': damage, 'details': raw}
+                            attacks.append(atk)
+                            index += 1
+
+        for attack in attacks:
+            attack['name'] = re.sub(r"(.+)\(.+\)", r"\1", attack['name']).strip()
+        monster['attacks'] = attacks
+        bestiary_log.debug(f"Parsed attacks for {monster['name']}: {attacks}")
+    return data
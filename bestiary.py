@@ -1,125 +1,295 @@
+import bisect
+import hashlib
+import logging
+import marshal
+import os
 import re
-
-from lib.parsing import render, recursive_tag
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from fractions import Fraction
+
+from lib import memo
+from lib.memo import content_key
+from lib.metrics import metrics
+from lib.parsing import VERSION as PARSING_VERSION, recursive_tag, render
+from lib.pipeline import Pipeline
+from lib.progress import Progress, progress
+from lib.shards import ShardedOutput, shard_name
+from lib.srd import get_srd
 from lib.utils import *
 
-ATTACK_RE = re.compile(r'(?:<i>)?(?:\w+ ){1,4}Attack:(?:</i>)? ([+-]?\d+) to hit, .*?(?:<i>)?'
-                       r'Hit:(?:</i>)? (?:(?:[+-]?\d+ \((.+?)\))|(?:([+-]?\d+))) (\w+) damage[., ]??'
-                       r'(?:in melee, or [+-]?\d+ \((.+?)\) (\w+) damage at range[,.]?)?'
-                       r'(?: or [+-]?\d+ \((.+?)\) (\w+) damage (?:\w+ ?)+[.,]?)?'
-                       r'(?: ?plus [+-]?\d+ \((.+?)\) (\w+) damage)?', re.IGNORECASE)
-JUST_DAMAGE_RE = re.compile(r'[+-]?\d+ \((.+?)\) (\w+) damage', re.IGNORECASE)
+# the fixed parts of a monster attack, each only ever matched at a known position
+ATTACK_ANCHOR_RE = re.compile(r'attack:', re.IGNORECASE)
+HIT_ANCHOR_RE = re.compile(r'hit:', re.IGNORECASE)
+TO_HIT_RE = re.compile(r'(?:</i>)? ([+-]?\d+) to hit, ', re.IGNORECASE)
+HIT_DICE_RE = re.compile(r'(?:</i>)? [+-]?\d+ \(', re.IGNORECASE)
+HIT_FLAT_RE = re.compile(r'(?:</i>)? ([+-]?\d+) (\w+) damage', re.IGNORECASE)
+RANGED_RE = re.compile(r'in melee, or [+-]?\d+ \(', re.IGNORECASE)
+VERSATILE_RE = re.compile(r' or [+-]?\d+ \(', re.IGNORECASE)
+BONUS_RE = re.compile(r' ?plus [+-]?\d+ \(', re.IGNORECASE)
+DICE_RE = re.compile(r'\d \(')
+# what may close the dice in parentheses opened by the above
+DAMAGE_CLOSE_RE = re.compile(r'\) (\w+) damage', re.IGNORECASE)
+RANGED_CLOSE_RE = re.compile(r'\) (\w+) damage at range[,.]?', re.IGNORECASE)
+VERSATILE_CLOSE_RE = re.compile(r'\) (\w+) damage (?:\w+ ?)+[.,]?', re.IGNORECASE)
 SKILL_NAMES = ('acrobatics', 'animalHandling', 'arcana', 'athletics', 'deception', 'history', 'initiative', 'insight',
                'intimidation', 'investigation', 'medicine', 'nature', 'perception', 'performance', 'persuasion',
                'religion', 'sleightOfHand', 'stealth', 'survival', 'strength', 'dexterity', 'constitution',
                'intelligence', 'wisdom', 'charisma')
+PARALLEL = "parallel" in sys.argv
+WORKERS = int(os.environ.get("BESTIARY_WORKERS", os.cpu_count() or 1))
+CHUNKS_PER_WORKER = 4
+INCREMENTAL = "incremental" in sys.argv
+STORE_PATH = os.environ.get("BESTIARY_STORE", "cache/bestiary-store.bin")
+SHARD = "shard" in sys.argv
+# the highest CR of each shard of a source, by tier of play
+CR_BUCKETS = ((4, 'cr0-4'), (10, 'cr5-10'), (16, 'cr11-16'), (float('inf'), 'cr17-up'))
+
+# a monster's output depends on this module and on how lib.parsing renders, so a change to either rebuilds all of them
+with open(__file__, 'rb') as _f:
+    VERSION = hashlib.sha1(_f.read() + PARSING_VERSION.encode()).hexdigest()
+
 log = logging.getLogger("bestiary")
 
 
 def get_bestiaries_from_web():
-    return get_indexed_data('bestiary/', 'monster.json', 'monster')
+    return get_indexed_data('bestiary/', 'monster')
 
 
 def parse_copies(data):
+    """
+    Resolves every _copy monster into a full one, in place of the _copy entry.
+    Copies of copies are resolved target first, whatever their order in the list. A copy whose target is missing, or
+    that (indirectly) copies itself, is dropped with a warning.
+    """
+    index = _copy_index(data)
+    resolved = list(data)
+    for i in progress(range(len(data)), "Resolving copies"):
+        _resolve_copy(i, resolved, index, set())
+    return [monster for monster in resolved if monster is not None]
+
+
+def _copy_index(data):
+    """:returns dict - The position of the first monster of each (source, name), which is what a _copy refers to."""
+    index = {}
     for i, monster in enumerate(data):
-        if '_copy' not in monster:
-            continue
-        original = monster.copy()  # how ironic
-        del original['_copy']
-
-        copymeta = monster['_copy']
-        log.info(f"Copying {copymeta['name']} onto {monster['name']}...")
-        to_copy = next(m for m in data if m['source'] == copymeta['source'] and m['name'] == copymeta['name'])
-
-        # I hate this so much
-        data_str = json.dumps(to_copy)
-        for replacer in copymeta.get('replacers', []):
-            data_str = data_str.replace(replacer['replace'], replacer['with'])
-        copied = json.loads(data_str)
-
-        for key, mod in copymeta.get('arrayModifiers', {}).items():
-            for action in mod:
-                if action['mode'] == 'replace':
-                    for entry in action['data']:
-                        to_replace = next(e for e in copied[key] if e['name'] == entry['replace'])
-                        entry.pop('replace')
-                        to_replace.update(entry)
-                elif action['mode'] == 'remove':
-                    if 'data' not in action:
-                        try:
-                            del copied[key]
-                        except KeyError:
-                            log.warning(f"I tried to delete key {key} but it does not exist")
-                            continue
-                    else:
-                        for to_remove in action['data']:
-                            try:
-                                copied[key].remove(next(e for e in copied[key] if e['name'] == to_remove['remove']))
-                            except StopIteration:
-                                log.warning(f"I tried to remove {key}.{to_remove['remove']} but it does not exist")
-                                continue
-                elif action['mode'] == 'prepend':
-                    for entry in reversed(action['data']):
-                        copied[key].insert(0, entry)
-                elif action['mode'] == 'append':
-                    copied[key].extend(action['data'])
-                else:
-                    log.warning(f"Unknown copy action: {action['mode']}")
-
-        copied.update(original)
-        data[i] = copied
-    return data
+        index.setdefault((monster['source'], monster['name']), i)
+    return index
+
+
+def _resolve_copy(i, data, index, resolving):
+    """
+    Resolves the monster at position i of data, resolving what it copies first.
+    :returns The resolved monster, or None if it was dropped.
+    """
+    monster = data[i]
+    if monster is None or '_copy' not in monster:
+        return monster
+    copymeta = monster['_copy']
+    target = index.get((copymeta['source'], copymeta['name']))
+    if target is None:
+        log.warning(f"{monster['name']} copies {copymeta['name']} ({copymeta['source']}), which does not exist; "
+                    f"dropping it")
+    elif i in resolving:
+        log.warning(f"{monster['name']} is part of a _copy cycle; dropping it")
+        target = None
+    else:
+        resolving.add(i)
+        target = _resolve_copy(target, data, index, resolving)
+        resolving.discard(i)
+        if target is None:
+            log.warning(f"{monster['name']} copies {copymeta['name']} ({copymeta['source']}), which was dropped; "
+                        f"dropping it too")
+
+    if target is None:
+        data[i] = None
+        return None
+    log.debug(f"Copying {copymeta['name']} onto {monster['name']}...")
+    replacers = [(r['replace'], r['with']) for r in copymeta.get('replacers', [])]
+    copied = _clone(target, replacers)
+    for key, mod in copymeta.get('arrayModifiers', {}).items():
+        for action in mod:
+            _modify_array(copied, key, action)
+    copied.update((k, v) for k, v in monster.items() if k != '_copy')
+    data[i] = copied
+    return copied
+
+
+def _clone(value, replacers):
+    """Deep-copies JSON data, applying the replacers to each string in it (but not to keys)."""
+    if isinstance(value, str):
+        for old, new in replacers:
+            value = value.replace(old, new)
+        return value
+    if isinstance(value, list):
+        return [_clone(v, replacers) for v in value]
+    if isinstance(value, dict):
+        return {k: _clone(v, replacers) for k, v in value.items()}
+    return value
+
+
+def _by_name(entries):
+    """:returns dict - The entries of each name, in order."""
+    out = {}
+    for e in entries:
+        out.setdefault(e.get('name'), []).append(e)
+    return out
+
+
+def _modify_array(copied, key, action):
+    if action['mode'] == 'replace':
+        entries = _by_name(copied.get(key, []))
+        for entry in action['data']:
+            if entry['replace'] not in entries:
+                log.warning(f"I tried to replace {key}.{entry['replace']} but it does not exist")
+                continue
+            entries[entry['replace']][0].update((k, v) for k, v in entry.items() if k != 'replace')
+    elif action['mode'] == 'remove':
+        if 'data' not in action:
+            if copied.pop(key, None) is None:
+                log.warning(f"I tried to delete key {key} but it does not exist")
+            return
+        entries = _by_name(copied.get(key, []))
+        removed = set()
+        for to_remove in action['data']:
+            if not entries.get(to_remove['remove']):
+                log.warning(f"I tried to remove {key}.{to_remove['remove']} but it does not exist")
+                continue
+            removed.add(id(entries[to_remove['remove']].pop(0)))
+        if removed:
+            copied[key] = [e for e in copied[key] if id(e) not in removed]
+    elif action['mode'] == 'prepend':
+        copied[key] = action['data'] + copied.get(key, [])
+    elif action['mode'] == 'append':
+        copied.setdefault(key, []).extend(action['data'])
+    else:
+        log.warning(f"Unknown copy action: {action['mode']}")
+
+
+class CopyTargets:
+    """
+    Resolves _copy monsters like parse_copies(), for a bestiary that is read one file at a time: only the monsters
+    something copies are kept in memory, resolved and marshalled, along with the file each one is first found in.
+    """
+
+    def __init__(self, files, load):
+        """
+        :param files: The monsters of each file, as fetched. Only read once, to find the monsters that are copied.
+        :param load: A function getting the monsters of a file again, by its position in files.
+        """
+        first = {}
+        copied = set()
+        for n, monsters in enumerate(files):
+            for monster in monsters:
+                first.setdefault((monster['source'], monster['name']), n)
+                if '_copy' in monster:
+                    copied.add((monster['_copy']['source'], monster['_copy']['name']))
+        self.files = {key: first[key] for key in copied if key in first}
+
+        # resolve the copied monsters among themselves, as what they copy is copied too
+        targets = []
+        for n in sorted(set(self.files.values())):
+            seen = set()
+            for monster in load(n):
+                key = (monster['source'], monster['name'])
+                if self.files.get(key) == n and key not in seen:
+                    seen.add(key)
+                    targets.append(monster)
+        index = _copy_index(targets)
+        for i in range(len(targets)):
+            _resolve_copy(i, targets, index, set())
+        # a dropped target stays in, as None, so that its copies are dropped for the same reason as by parse_copies()
+        self.resolved = {key: None if targets[i] is None else marshal.dumps(targets[i]) for key, i in index.items()}
+
+    def resolve(self, n, monsters):
+        """
+        :param n: The position of the file the monsters are from.
+        :param monsters: The monsters of the file, as fetched.
+        :returns list - The monsters with their copies resolved, without the dropped ones.
+        """
+        out = []
+        seen = set()
+        for monster in monsters:
+            key = (monster['source'], monster['name'])
+            if '_copy' in monster and self.files.get(key) == n and key not in seen:
+                seen.add(key)
+                monster = self._target(key)  # already resolved, along with the other copied monsters
+            elif '_copy' in monster:
+                copymeta = monster['_copy']
+                target = (copymeta['source'], copymeta['name'])
+                data, index = [monster], {}
+                if target in self.resolved:
+                    data.append(self._target(target))
+                    index[target] = 1
+                monster = _resolve_copy(0, data, index, set())
+            else:
+                seen.add(key)
+            if monster is not None:
+                out.append(monster)
+        return out
+
+    def _target(self, key):
+        blob = self.resolved[key]
+        return None if blob is None else marshal.loads(blob)
 
 
 def srdfilter(data):
-    with open('srd/srd-monsters.txt') as f:
-        srd = [s.strip().lower() for s in f.read().split('\n')]
-
+    srd = get_srd('monsters')
     for monster in data:
-        if monster['name'].lower() in srd:
-            monster['srd'] = True
-        else:
-            monster['srd'] = False
+        monster['srd'] = srd.match(monster['name'])
+    srd.report()
     return data
 
 
 def parse_ac(data):
-    for monster in data:
-        log.info(f"Parsing {monster['name']} AC")
-        if isinstance(monster['ac'][0], int):
-            monster['ac'] = {'ac': int(monster['ac'][0])}
-        elif isinstance(monster['ac'][0], dict):
-            monster['ac'] = {'ac': int(monster['ac'][0]['ac']),
-                             'armortype': render(monster['ac'][0].get('from', []), join_char=', ')}
-        else:
-            log.warning(f"Unknown AC type: {monster['ac']}")
-            raise Exception
+    for monster in progress(data, "Parsing AC"):
+        parse_monster_ac(monster)
     return data
 
 
+def parse_monster_ac(monster):
+    log.debug(f"Parsing {monster['name']} AC")
+    if isinstance(monster['ac'][0], int):
+        monster['ac'] = {'ac': int(monster['ac'][0])}
+    elif isinstance(monster['ac'][0], dict):
+        monster['ac'] = {'ac': int(monster['ac'][0]['ac']),
+                         'armortype': render(monster['ac'][0].get('from', []), join_char=', ')}
+    else:
+        log.warning(f"Unknown AC type: {monster['ac']}")
+        raise Exception
+    return monster
+
+
 def translate_skills(data):
-    for monster in data:
-        log.info(f"Parsing {monster['name']} skills")
-        saves = monster.get('save', {})
-        skills = monster.get('skill', {})
+    for monster in progress(data, "Parsing skills"):
+        translate_monster_skills(monster)
+    return data
 
-        new_saves = {}
-        new_skills = {}
 
-        for k, v in saves.items():
-            new_k = {"str": "strengthSave", "dex": "dexteritySave", "con": "constitutionSave",
-                     "int": "intelligenceSave", "wis": "wisdomSave", "cha": "charismaSave"}[k]
-            new_saves[new_k] = int(v)
+def translate_monster_skills(monster):
+    log.debug(f"Parsing {monster['name']} skills")
+    saves = monster.get('save', {})
+    skills = monster.get('skill', {})
 
-        for k, v in skills.items():
-            if k not in SKILL_NAMES:
-                continue
-            new_k = re.sub(r"\s+(\w)", lambda m: m.group(1).upper(), k.lower())  # spaced to upper
-            new_skills[new_k] = int(v)
+    new_saves = {}
+    new_skills = {}
 
-        monster['save'] = new_saves
-        monster['skill'] = new_skills
-    return data
+    for k, v in saves.items():
+        new_k = {"str": "strengthSave", "dex": "dexteritySave", "con": "constitutionSave",
+                 "int": "intelligenceSave", "wis": "wisdomSave", "cha": "charismaSave"}[k]
+        new_saves[new_k] = int(v)
+
+    for k, v in skills.items():
+        if k not in SKILL_NAMES:
+            continue
+        new_k = re.sub(r"\s+(\w)", lambda m: m.group(1).upper(), k.lower())  # spaced to upper
+        new_skills[new_k] = int(v)
+
+    monster['save'] = new_saves
+    monster['skill'] = new_skills
+    return monster
 
 
 def parse_spellcasting(monster):
@@ -167,14 +337,20 @@ def parse_spellcasting(monster):
     sab = usual_sab[0]
     monster['spellcasting'] = {'spells': known_spells, 'dc': dc, 'attackBonus': sab,
                                'casterLevel': caster_level}  # overwrite old
-    log.info(f"Lvl {caster_level}; DC: {dc}; SAB: {sab}; Spells: {known_spells}")
+    log.debug(f"Lvl {caster_level}; DC: {dc}; SAB: {sab}; Spells: {known_spells}")
 
 
 def monster_render(data):
-    for monster in data:
-        log.info(f"Rendering {monster['name']}")
+    for monster in progress(data, "Rendering monsters"):
+        render_monster(monster)
+    return data
+
+
+def render_monster(monster):
+    log.debug(f"Rendering {monster['name']}")
+    with metrics.timer('bestiary.render', monster['name']):
         for t in ('trait', 'action', 'reaction', 'legendary'):
-            log.info(f"  Rendering {t}s")
+            log.debug(f"  Rendering {t}s")
             if t in monster:
                 temp = []
                 for entry in monster[t]:
@@ -182,9 +358,9 @@ def monster_render(data):
                     temp.append({'name': entry.get('name', ''), 'text': text})
                 monster[t] = temp
 
-        if 'spellcasting' in monster:
-            parse_spellcasting(monster)
-    return data
+    if 'spellcasting' in monster:
+        parse_spellcasting(monster)
+    return monster
 
 
 def extract_spell(text):
@@ -203,71 +379,416 @@ def get_spell_level(level):
     return f"{level}th level"
 
 
+class _AttackLine:
+    """
+    One line of an entry's text, read for its attacks and damage rolls; nothing is looked for across a line break.
+    Every pattern used here matches a fixed shape at a known position. Finding the first "Hit:", or the first closing
+    ") <type> damage", after some position is a lookup among the matches of a single pass over the line, so no step
+    rescans the line and the time taken stays linear however the text is built.
+    """
+
+    def __init__(self, line):
+        self.line = line
+        self._found = {}
+        self._hits = None
+
+    def _next(self, pattern, pos):
+        """:returns The first match of the pattern starting at or after pos, or None."""
+        try:
+            starts, matches = self._found[pattern]
+        except KeyError:
+            matches = list(pattern.finditer(self.line))
+            starts = [m.start() for m in matches]
+            self._found[pattern] = starts, matches
+        i = bisect.bisect_left(starts, pos)
+        return matches[i] if i < len(starts) else None
+
+    def _dice(self, prefix, close, pos):
+        """
+        Matches the prefix, which ends in an opening parenthesis, at pos, and the first close after at least one more
+        character.
+        :returns (dice, close match) or None.
+        """
+        m = prefix.match(self.line, pos)
+        if m is None:
+            return None
+        closing = self._next(close, m.end() + 1)
+        if closing is None:
+            return None
+        return self.line[m.end():closing.start()], closing
+
+    def _damage_at(self, pos):
+        """:returns (end, (dice, flat damage, type)) for the damage right after a "Hit:" ending at pos, or None."""
+        dice = self._dice(HIT_DICE_RE, DAMAGE_CLOSE_RE, pos)
+        if dice is not None:
+            return dice[1].end(), (dice[0], None, dice[1].group(1))
+        m = HIT_FLAT_RE.match(self.line, pos)
+        if m is not None:
+            return m.end(), (None, m.group(1), m.group(2))
+        return None
+
+    def _first_hit(self, pos):
+        """:returns What _damage_at() returns for the first "Hit:" at or after pos that is followed by damage."""
+        if self._hits is None:
+            hits = [(m.start(), self._damage_at(m.end())) for m in HIT_ANCHOR_RE.finditer(self.line)]
+            hits = [(start, damage) for start, damage in hits if damage is not None]
+            self._hits = [start for start, _ in hits], [damage for _, damage in hits]
+        starts, hits = self._hits
+        i = bisect.bisect_left(starts, pos)
+        return hits[i] if i < len(starts) else None
+
+    def attacks(self):
+        """
+        :returns list - For each attack, a tuple of its bonus; its dice or flat damage and type; then the dice and type
+        of its ranged, versatile and bonus damage, None where it has none.
+        """
+        line = self.line
+        out = []
+        pos = 0
+        for anchor in ATTACK_ANCHOR_RE.finditer(line):
+            start = anchor.start()
+            # "Attack:" ends up to four words, the last of which must begin at or after where the previous attack ended
+            if start - 2 < pos or line[start - 1] != ' ' or not (line[start - 2].isalnum() or line[start - 2] == '_'):
+                continue
+            to_hit = TO_HIT_RE.match(line, anchor.end())
+            if to_hit is None:
+                continue
+            hit = self._first_hit(to_hit.end())
+            if hit is None:
+                continue
+            pos, damage = hit
+            extra = []
+            for prefix, close in ((RANGED_RE, RANGED_CLOSE_RE), (VERSATILE_RE, VERSATILE_CLOSE_RE),
+                                  (BONUS_RE, DAMAGE_CLOSE_RE)):
+                dice = self._dice(prefix, close, pos)
+                if dice is None:
+                    extra += (None, None)
+                else:
+                    extra += (dice[0], dice[1].group(1))
+                    pos = dice[1].end()
+            out.append((to_hit.group(1), *damage, *extra))
+        return out
+
+    def damage(self):
+        """:returns list - The (dice, type) of each damage roll."""
+        out = []
+        pos = 0
+        for opening in DICE_RE.finditer(self.line):
+            if opening.start() < pos:
+                continue
+            closing = self._next(DAMAGE_CLOSE_RE, opening.end() + 1)
+            if closing is None:
+                break
+            out.append((self.line[opening.end():closing.start()], closing.group(1)))
+            pos = closing.end()
+        return out
+
+
+def find_attacks(text):
+    """:returns list - The attacks in a monster's text, as tuples described in _AttackLine.attacks()."""
+    if not ATTACK_ANCHOR_RE.search(text):
+        return []
+    return [attack for line in text.split('\n') for attack in _AttackLine(line).attacks()]
+
+
+def find_damage(text):
+    """:returns list - The (dice, type) of each damage roll in a monster's text."""
+    return [damage for line in text.split('\n') for damage in _AttackLine(line).damage()]
+
+
 def parse_attacks(data):
-    for monster in data:
-        attacks = []
-        for t in ('trait', 'action', 'reaction', 'legendary'):
-            if t in monster:
-                for entry in monster[t]:
-                    name = entry['name']
-                    raw = entry['text']
-                    raw_atks = list(ATTACK_RE.finditer(raw))
-                    raw_damage = list(JUST_DAMAGE_RE.finditer(raw))
-
-                    if raw_atks:
-                        for atk in raw_atks:
-                            if atk.group(7) and atk.group(8):  # versatile
-                                damage = f"{atk.group(7)}[{atk.group(8)}]"
-                                if atk.group(9) and atk.group(10):  # bonus damage
-                                    damage += f"+{atk.group(9)}[{atk.group(10)}]"
-                                attacks.append(
-                                    {'name': f"2 Handed {name}", 'attackBonus': atk.group(1).lstrip('+'),
-                                     'damage': damage,
-                                     'details': raw})
-                            if atk.group(5) and atk.group(6):  # ranged
-                                damage = f"{atk.group(5)}[{atk.group(6)}]"
-                                if atk.group(9) and atk.group(10):  # bonus damage
-                                    damage += f"+{atk.group(9)}[{atk.group(10)}]"
-                                attacks.append(
-                                    {'name': f"Ranged {name}", 'attackBonus': atk.group(1).lstrip('+'),
-                                     'damage': damage,
-                                     'details': raw})
-                            damage = f"{atk.group(2) or atk.group(3)}[{atk.group(4)}]"
-                            if atk.group(9) and atk.group(10):  # bonus damage
-                                damage += f"+{atk.group(9)}[{atk.group(10)}]"
-                            attacks.append(
-                                {'name': name, 'attackBonus': atk.group(1).lstrip('+'), 'damage': damage,
-                                 'details': raw})
-                    else:
-                        index = 1
-                        for dmg in raw_damage:
-                            damage = f"{dmg.group(1)}[{dmg.group(2)}]"
-                            if index > 1:
-                                name = f"{name} {index}"
-                            atk = {'name': name, 'attackBonus': None, 'damage': damage, 'details': raw}
-                            attacks.append(atk)
-                            index += 1
-
-        for attack in attacks:
-            attack['name'] = re.sub(r"(.+)\(.+\)", r"\1", attack['name']).strip()
-        monster['attacks'] = attacks
-        log.debug(f"Parsed attacks for {monster['name']}: {attacks}")
+    for monster in progress(data, "Parsing attacks"):
+        parse_monster_attacks(monster)
     return data
 
 
+def parse_monster_attacks(monster):
+    attacks = []
+    for t in ('trait', 'action', 'reaction', 'legendary'):
+        if t in monster:
+            for entry in monster[t]:
+                name = entry['name']
+                raw = entry['text']
+                raw_atks = find_attacks(raw)
+
+                if raw_atks:
+                    for bonus, dice, flat, dtype, r_dice, r_type, v_dice, v_type, b_dice, b_type in raw_atks:
+                        bonus = bonus.lstrip('+')
+                        extra = f"+{b_dice}[{b_type}]" if b_dice and b_type else ''  # bonus damage
+                        if v_dice and v_type:  # versatile
+                            attacks.append({'name': f"2 Handed {name}", 'attackBonus': bonus,
+                                            'damage': f"{v_dice}[{v_type}]{extra}", 'details': raw})
+                        if r_dice and r_type:  # ranged
+                            attacks.append({'name': f"Ranged {name}", 'attackBonus': bonus,
+                                            'damage': f"{r_dice}[{r_type}]{extra}", 'details': raw})
+                        attacks.append({'name': name, 'attackBonus': bonus,
+                                        'damage': f"{dice or flat}[{dtype}]{extra}", 'details': raw})
+                else:
+                    index = 1
+                    for dice, dtype in find_damage(raw):
+                        damage = f"{dice}[{dtype}]"
+                        if index > 1:
+                            name = f"{name} {index}"
+                        atk = {'name': name, 'attackBonus': None, 'damage': damage, 'details': raw}
+                        attacks.append(atk)
+                        index += 1
+
+    for attack in attacks:
+        attack['name'] = re.sub(r"(.+)\(.+\)", r"\1", attack['name']).strip()
+    monster['attacks'] = attacks
+    log.debug(f"Parsed attacks for {monster['name']}: {attacks}")
+    return monster
+
+
+def monster_pipeline(tag_stats):
+    """
+    :param tag_stats: The Counter recursive_tag() adds its counts to.
+    :returns Pipeline - Every stage after srdfilter, fused to run on a few monsters at a time.
+    """
+    return Pipeline("Transforming monsters", (
+        ('parse_ac', parse_monster_ac),
+        ('translate_skills', translate_monster_skills),
+        ('monster_render', render_monster),
+        ('recursive_tag', lambda monster: recursive_tag(monster, tag_stats)),
+        ('parse_attacks', parse_monster_attacks)
+    ))
+
+
+def transform(data):
+    """
+    Runs every stage after srdfilter, each of which works on one monster at a time, through the monster_pipeline().
+    Gives the same output as calling parse_ac(), translate_skills(), monster_render(), recursive_tag() and
+    parse_attacks() in turn.
+    :returns (data, tag_stats) - The monsters, rendered and with their attacks, and the counts of recursive_tag().
+    """
+    tag_stats = Counter()
+    pipeline = monster_pipeline(tag_stats)
+    data = pipeline.run(data)
+    pipeline.report()
+    return data, tag_stats
+
+
+def _init_worker():
+    setup_logging()  # a no-op when forked, but spawned workers start from scratch
+    logging.getLogger('lib.progress').setLevel(logging.WARNING)  # the parent reports progress over all chunks
+    metrics.reset()  # forked workers start with the parent's counts, which it still holds itself
+
+
+def _transform_chunk(chunk):
+    tag_stats = Counter()
+    pipeline = monster_pipeline(tag_stats)
+    chunk = pipeline.run(chunk)
+    memo.flush_all()  # pool workers exit without running atexit hooks
+    return chunk, tag_stats, pipeline.times, metrics.export()
+
+
+def transform_parallel(data, workers=WORKERS):
+    """
+    Runs transform() over chunks of the monsters in a pool of processes, putting the results back in their order.
+    The output is the same as transform()'s.
+    :param workers: The number of processes.
+    """
+    size = max(-(-len(data) // (workers * CHUNKS_PER_WORKER)), 1)
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    reporter = Progress(f"Transforming monsters on {workers} workers", len(data))
+    out = []
+    tag_stats = Counter()
+    pipeline = monster_pipeline(tag_stats)  # only adds up the stage times of the workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for chunk, chunk_tag_stats, stage_times, chunk_metrics in executor.map(_transform_chunk, chunks):
+            out.extend(chunk)
+            tag_stats.update(chunk_tag_stats)
+            pipeline.merge(stage_times)
+            metrics.merge(chunk_metrics)
+            reporter.update(len(chunk))
+    reporter.done()
+    pipeline.report()
+    return out, tag_stats
+
+
+def input_hashes(data):
+    """
+    :param data: The monsters as fetched, before parse_copies().
+    :returns list - For each monster, a hash of everything its output depends on: its own entry, the entries it
+    (indirectly) copies, and the code.
+    """
+    index = _copy_index(data)
+    out = []
+    for monster in data:
+        chain = [monster]
+        seen = {id(monster)}
+        while '_copy' in chain[-1]:
+            copymeta = chain[-1]['_copy']
+            target = index.get((copymeta['source'], copymeta['name']))
+            if target is None or id(data[target]) in seen:
+                break
+            seen.add(id(data[target]))
+            chain.append(data[target])
+        out.append(content_key(VERSION, *chain))
+    return out
+
+
+def load_store(path=STORE_PATH):
+    """:returns dict - (source, name) -> {input hash: output, or None if it was dropped} of the last incremental run."""
+    try:
+        with open(path, 'rb') as f:
+            return marshal.loads(f.read())
+    except (FileNotFoundError, EOFError, ValueError, TypeError):
+        return {}
+
+
+def save_store(store, path=STORE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.tmp", 'wb') as f:
+        marshal.dump(store, f)
+    os.replace(f"{path}.tmp", path)  # an interrupted run leaves the last store intact
+
+
+def build_incremental(data, store_path=STORE_PATH):
+    """
+    Resolves copies and runs transform() on only the monsters whose input_hashes() are not in the store, and splices
+    the stored output of the others back in, in their order. The store is then rewritten with this run's monsters.
+    :param data: The monsters as fetched, before parse_copies().
+    :param store_path: Where the store is kept.
+    :returns (data, tag_stats) - What parse_copies(), srdfilter() and transform() would give, and the tag counts of
+    the monsters that were built.
+    """
+    hashes = input_hashes(data)
+    store = load_store(store_path)
+    outputs = [None] * len(data)
+    dirty = []
+    for i, (monster, digest) in enumerate(zip(data, hashes)):
+        stored = store.get((monster['source'], monster['name']), {})
+        if digest in stored:
+            outputs[i] = stored[digest]
+        else:
+            dirty.append(i)
+    log.info(f"{len(data) - len(dirty)} monsters unchanged since the last run, {len(dirty)} to build")
+
+    srd = get_srd('monsters')
+    for output in outputs:
+        if output is not None:  # the SRD list is not part of the hash, so a change to it does not rebuild everything
+            output['srd'] = srd.match(output['name'])
+
+    index = _copy_index(data)
+    resolved = list(data)
+    for i in dirty:
+        _resolve_copy(i, resolved, index, set())
+    todo = srdfilter([resolved[i] for i in dirty if resolved[i] is not None])
+    built, tag_stats = transform_parallel(todo) if PARALLEL else transform(todo)
+    built = iter(built)
+    for i in dirty:
+        if resolved[i] is not None:
+            outputs[i] = next(built)
+
+    new_store = {}
+    for monster, digest, output in zip(data, hashes, outputs):
+        new_store.setdefault((monster['source'], monster['name']), {})[digest] = output
+    # with nothing built, the new store only differs if monsters were removed upstream
+    if dirty or sum(map(len, new_store.values())) != sum(map(len, store.values())):
+        save_store(new_store, store_path)
+    return [output for output in outputs if output is not None], tag_stats
+
+
+def cr_bucket(monster):
+    """:returns str - The CR_BUCKETS shard of the monster, or "cr-other" if its CR is not a number in any of them."""
+    cr = monster.get('cr')
+    if isinstance(cr, dict):  # with a lair or coven CR besides
+        cr = cr.get('cr')
+    try:
+        cr = Fraction(cr)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 'cr-other'
+    return next((bucket for highest, bucket in CR_BUCKETS if cr <= highest), 'cr-other')
+
+
+def monster_shard(monster):
+    return shard_name(monster['source'], cr_bucket(monster))
+
+
+def shard_output():
+    """:returns ShardedOutput - out/bestiary/, the monsters split by source and CR for the "shard" flag."""
+    return ShardedOutput('bestiary', monster_shard)
+
+
+def stream_monsters():
+    """
+    Yields the monsters of every bestiary file, copies resolved as by parse_copies(), one file at a time. The files
+    are read twice: once to find the monsters that are copied, which are all that is kept, and then to yield them.
+    """
+    sources = []
+
+    def files():
+        for source, monsters in iter_indexed_data('bestiary/', 'monster'):
+            sources.append(source)
+            yield monsters
+
+    copies = CopyTargets(files(), lambda n: load_indexed_source('bestiary/', 'monster', sources[n]))
+    for n, source in enumerate(sources):
+        yield from copies.resolve(n, load_indexed_source('bestiary/', 'monster', source))
+
+
+def build_streaming():
+    """
+    Builds the bestiary as it is read, writing each monster out once it is transformed, so that only a few files'
+    worth of monsters are in memory at once. The outputs are the same as those of a normal run, shards included, or
+    NDJSON with the "ndjson" flag.
+    :returns (tag_stats, srd_filename) - The counts of recursive_tag(), and the file the SRD monsters were written to.
+    """
+    srd = get_srd('monsters')
+    tag_stats = Counter()
+    pipeline = monster_pipeline(tag_stats)
+
+    def srd_matched(monsters):
+        for monster in monsters:
+            monster['srd'] = srd.match(monster['name'])
+            yield monster
+
+    reporter = Progress("Streaming monsters", None)
+    with OutputWriter('bestiary.json') as out, OutputWriter('srd-bestiary.json') as srd_out, \
+            (shard_output() if SHARD else nullcontext()) as shards:
+        for monster in pipeline.stream(srd_matched(stream_monsters())):
+            out.write(monster)
+            if monster['srd']:
+                srd_out.write(monster)
+            if shards is not None:
+                shards.write(monster)
+            reporter.update()
+    reporter.done()
+    srd.report()
+    pipeline.report()
+    return tag_stats, srd_out.filename
+
+
 def run():
+    if STREAM:
+        tag_stats, srd_filename = build_streaming()
+        log.info(f"Rendered leftover tags in {tag_stats['changed']} strings")
+        diff(srd_filename)
+        metrics.dump('bestiary')
+        return
+
     data = get_bestiaries_from_web()
-    data = parse_copies(data)
-    data = srdfilter(data)
-    data = parse_ac(data)
-    data = translate_skills(data)
-    rendered = monster_render(data)
-    rendered = recursive_tag(rendered)
-    out = parse_attacks(rendered)
-    dump(out, 'bestiary.json')
+    if INCREMENTAL:
+        data, tag_stats = build_incremental(data)
+    else:
+        data = parse_copies(data)
+        data = srdfilter(data)
+        if PARALLEL:
+            data, tag_stats = transform_parallel(data)
+        else:
+            data, tag_stats = transform(data)
+    log.info(f"Rendered leftover tags in {tag_stats['changed']} strings")
+    dump(data, 'bestiary.json')
+    if SHARD:
+        with shard_output() as shards:
+            for monster in data:
+                shards.write(monster)
     dump(srdonly(data), 'srd-bestiary.json')
     diff('srd-bestiary.json')
+    metrics.dump('bestiary')
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()
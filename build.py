@@ -0,0 +1,76 @@
+import importlib
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from lib import memo, utils
+from lib.utils import FETCH_WORKERS, FROM_SNAPSHOT, INDEXED_DATA, SPELL_AUTOMATION_SRC, get_data, get_indexed_data, \
+    setup_logging
+
+# the source files (or index roots) each dataset reads
+DEPENDENCIES = {
+    'bestiary': ('bestiary/',),
+    'spells': ('spells/', SPELL_AUTOMATION_SRC),
+    'items': ('items.json', 'basicitems.json', 'magicvariants.json', 'objects.json'),
+    'classes': ('class/', 'optionalfeatures.json'),
+    'races': ('races.json',),
+    'feats': ('feats.json',),
+    'backgrounds': ('backgrounds.json',),
+    'names': ('names.json',)
+}
+DATASETS = tuple(DEPENDENCIES)
+FETCH_FLAGS = ('nocache', 'update', 'revalidate')
+BUILD_WORKERS = int(os.environ.get("BUILD_WORKERS", os.cpu_count() or 1))
+
+log = logging.getLogger("build")
+
+
+def prefetch(datasets):
+    """Fetches each file the datasets depend on once, up front, so that the dataset builds only ever read the cache."""
+    if FROM_SNAPSHOT:
+        return
+    paths = list(dict.fromkeys(path for name in datasets for path in DEPENDENCIES[name]))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(FETCH_WORKERS, 1)) as executor:
+        jobs = [executor.submit(get_indexed_data, path, INDEXED_DATA[path]) if path in INDEXED_DATA else
+                executor.submit(get_data, path) for path in paths]
+        for job in jobs:
+            job.result()
+    log.info(f"Fetched all data in {time.perf_counter() - start:.2f}s")
+
+
+def _init_worker():
+    # the cache was just filled by prefetch(), so workers must not fetch again
+    sys.argv = [a for a in sys.argv if a not in FETCH_FLAGS]
+    utils.REVALIDATE = utils.UPDATE = False
+    setup_logging()  # a no-op when forked, but spawned workers start from scratch
+
+
+def build(name):
+    start = time.perf_counter()
+    importlib.import_module(name).run()
+    memo.flush_all()  # pool workers exit without running atexit hooks
+    memo.log_stats(reset=True)
+    return time.perf_counter() - start
+
+
+def run():
+    datasets = [a for a in sys.argv[1:] if a in DATASETS] or list(DATASETS)
+    start = time.perf_counter()
+    prefetch(datasets)
+
+    with ProcessPoolExecutor(max_workers=min(BUILD_WORKERS, len(datasets)), initializer=_init_worker) as executor:
+        timings = dict(zip(datasets, executor.map(build, datasets)))
+    total = time.perf_counter() - start
+
+    log.info("Build summary:")
+    for name, elapsed in sorted(timings.items(), key=lambda t: t[1], reverse=True):
+        log.info(f"  {name:<12} {elapsed:8.2f}s")
+    log.info(f"  {'total':<12} {total:8.2f}s (serial would be ~{sum(timings.values()):.2f}s)")
+
+
+if __name__ == '__main__':
+    setup_logging()
+    run()
@@ -1,7 +1,10 @@
 import logging
+from collections import Counter
 
+from lib.metrics import metrics
 from lib.parsing import recursive_tag, render
-from lib.utils import diff, dump, fix_dupes, get_data, get_indexed_data, remove_ignored, srdonly
+from lib.progress import progress
+from lib.utils import diff, dump, get_data, get_indexed_data, resolve_conflicts, setup_logging, srdonly
 
 SRD = ('Barbarian', 'Bard', 'Cleric', 'Druid', 'Fighter', 'Monk', 'Paladin', 'Ranger', 'Rogue', 'Sorcerer', 'Warlock',
        'Wizard')
@@ -16,13 +19,13 @@ log = logging.getLogger("classes")
 
 
 def get_classes_from_web():
-    return get_indexed_data('class/', 'classes.json', 'class')
+    return get_indexed_data('class/', 'class')
 
 
 def filter_ignored(data):
-    data = remove_ignored(data, IGNORED_SOURCES)
+    data, _ = resolve_conflicts(data, ignored=IGNORED_SOURCES)
     for _class in data:
-        _class['subclasses'] = remove_ignored(_class['subclasses'], IGNORED_SOURCES)
+        _class['subclasses'], _ = resolve_conflicts(_class['subclasses'], ignored=IGNORED_SOURCES)
     return data
 
 
@@ -43,15 +46,18 @@ def srdfilter(data):
 
 def parse_classfeats(data):
     out = []
-    for _class in data:
-        log.info(f"Parsing classfeats for class {_class['name']}...")
+    for _class in progress(data, "Parsing classes"):
+        log.debug(f"Parsing classfeats for class {_class['name']}...")
         for level in _class.get('classFeatures', []):
             for feature in level:
+                name = f"{_class['name']}: {feature['name']}"
+                with metrics.timer('classes.render', name):
+                    text = render(feature['entries'])
                 fe = {
-                    'name': f"{_class['name']}: {feature['name']}",
-                    'text': render(feature['entries']), 'srd': _class['srd']
+                    'name': name,
+                    'text': text, 'srd': _class['srd']
                 }
-                log.info(f"Found feature: {fe['name']}")
+                log.debug(f"Found feature: {fe['name']}")
                 out.append(fe)
                 options = [e for e in feature['entries'] if
                            isinstance(e, dict) and e.get('type') == 'options']
@@ -63,7 +69,7 @@ def parse_classfeats(data):
                             'srd': _class['srd']
 
                         }
-                        log.info(f"Found option: {fe['name']}")
+                        log.debug(f"Found option: {fe['name']}")
                         out.append(fe)
                 subentries = [e for e in feature['entries'] if
                               isinstance(e, dict) and e.get('type') == 'entries']
@@ -74,10 +80,10 @@ def parse_classfeats(data):
                         'srd': _class['srd']
 
                     }
-                    log.info(f"Found subentry: {fe['name']}")
+                    log.debug(f"Found subentry: {fe['name']}")
                     out.append(fe)
         for subclass in _class.get('subclasses', []):
-            log.info(f"Parsing classfeats for subclass {subclass['name']}...")
+            log.debug(f"Parsing classfeats for subclass {subclass['name']}...")
             for level in subclass.get('subclassFeatures', []):
                 for feature in level:
                     options = [f for f in feature.get('entries', []) if
@@ -90,7 +96,7 @@ def parse_classfeats(data):
                                 'text': render(opt_entry['entries']),
                                 'srd': subclass.get('srd', False)
                             }
-                            log.info(f"Found option: {fe['name']}")
+                            log.debug(f"Found option: {fe['name']}")
                             out.append(fe)
                     for entry in feature.get('entries', []):
                         if not isinstance(entry, dict): continue
@@ -99,7 +105,7 @@ def parse_classfeats(data):
                             'name': f"{_class['name']}: {subclass['name']}: {entry['name']}",
                             'text': render(entry['entries']), 'srd': subclass.get('srd', False)
                         }
-                        log.info(f"Found feature: {fe['name']}")
+                        log.debug(f"Found feature: {fe['name']}")
                         out.append(fe)
                         options = [e for e in entry['entries'] if
                                    isinstance(e, dict) and e.get('type') == 'options']
@@ -111,7 +117,7 @@ def parse_classfeats(data):
                                     'text': render(opt_entry['entries']),
                                     'srd': subclass.get('srd', False)
                                 }
-                                log.info(f"Found option: {fe['name']}")
+                                log.debug(f"Found option: {fe['name']}")
                                 out.append(fe)
                         subentries = [e for e in entry['entries'] if
                                       isinstance(e, dict) and e.get('type') == 'entries']
@@ -123,8 +129,9 @@ def parse_classfeats(data):
                                 'srd': _class['srd']
 
                             }
-                            log.info(f"Found subentry: {fe['name']}")
+                            log.debug(f"Found subentry: {fe['name']}")
                             out.append(fe)
+    log.info(f"Found {len(out)} class features")
     return out
 
 
@@ -145,8 +152,8 @@ def parse_invocations():
     optfeats = get_data('optionalfeatures.json')['optionalfeature']
     invocs = [i for i in optfeats if i['featureType'] == 'EI']
 
-    for invoc in invocs:
-        log.info(f"Parsing invocation {invoc['name']}")
+    for invoc in progress(invocs, "Parsing invocations"):
+        log.debug(f"Parsing invocation {invoc['name']}")
         text = render(invoc['entries'])
         if 'prerequisite' in invoc:
             prereqs = []
@@ -174,7 +181,7 @@ def parse_invocations():
 def fix_subclass_dupes(data):
     for _class in data:
         if 'subclasses' in _class:
-            _class['subclasses'] = fix_dupes(_class['subclasses'], SOURCE_HIERARCHY)
+            _class['subclasses'], _ = resolve_conflicts(_class['subclasses'], SOURCE_HIERARCHY)
     return data
 
 
@@ -190,7 +197,9 @@ def run():
     data = get_classes_from_web()
     data = filter_ignored(data)
     data = srdfilter(data)
-    data = recursive_tag(data)
+    tag_stats = Counter()
+    data = recursive_tag(data, tag_stats)
+    log.info(f"Rendered tags in {tag_stats['changed']} strings")
     data = fix_subclass_dupes(data)
     classfeats = parse_classfeats(data)
     classfeats.extend(parse_invocations())
@@ -200,7 +209,9 @@ def run():
     diff('srd-classes.json')
     dump(srdonly(classfeats), 'srd-classfeats.json')
     diff('srd-classfeats.json')
+    metrics.dump('classes')
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()
@@ -1,7 +1,9 @@
 import logging
 
+from lib.metrics import metrics
 from lib.parsing import render, ABILITY_MAP
-from lib.utils import get_data, dump, fix_dupes, diff, english_join, srdonly
+from lib.progress import progress
+from lib.utils import get_data, dump, resolve_conflicts, diff, english_join, setup_logging, srdonly
 
 log = logging.getLogger("feats")
 
@@ -51,9 +53,10 @@ def parse_ability(feat):
 
 def prerender(data):
     out = []
-    for feat in data:
+    for feat in progress(data, "Rendering feats"):
         log.debug(feat['name'])
-        desc = render(feat['entries'])
+        with metrics.timer('feats.render', feat['name']):
+            desc = render(feat['entries'])
         prereq = parse_prereq(feat)
         ability = parse_ability(feat)
 
@@ -82,11 +85,14 @@ def run():
     data = get_latest_feats()
     data = prerender(data)
     data = srdfilter(data)
-    data = fix_dupes(data, SOURCE_HIERARCHY, True)
+    data, report = resolve_conflicts(data, SOURCE_HIERARCHY, remove_dupes=True)
+    log.info(f"Resolved {len(report)} source conflicts")
     dump(data, 'feats.json')
     dump(srdonly(data), 'srd-feats.json')
     diff('srd-feats.json')
+    metrics.dump('feats')
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()
@@ -1,10 +1,12 @@
-import copy
-import fnmatch
 import logging
 import re
+from collections import Counter
 
+from lib.metrics import metrics
 from lib.parsing import recursive_tag, render
-from lib.utils import diff, dump, get_data, srdonly
+from lib.progress import Progress, progress
+from lib.srd import get_srd
+from lib.utils import OutputWriter, STREAM, diff, dump, get_data, setup_logging, srdonly
 
 log = logging.getLogger("items")
 
@@ -24,11 +26,11 @@ PROPS = {"A": "ammunition", "LD": "loading", "L": "light", "F": "finesse", "T":
          "2H": "two-handed", "V": "versatile", "S": "special", "RLD": "reload", "BF": "burst fire", "CREW": "Crew",
          "PASS": "Passengers", "CARGO": "Cargo", "DMGT": "Damage Threshold", "SHPREP": "Ship Repairs"}
 
+ITEM_FILES = (("items.json", 'item'), ("basicitems.json", 'basicitem'), ("magicvariants.json", 'variant'))
+
 
 def get_latest_items():
-    return get_data("items.json")['item'] + \
-           get_data("basicitems.json")['basicitem'] + \
-           get_data("magicvariants.json")['variant']
+    return [item for filename, key in ITEM_FILES for item in get_data(filename)[key]]
 
 
 def moneyfilter(data):
@@ -74,135 +76,171 @@ def object_actions(objects):
 
 
 def srdfilter(data):
-    transforms = {}
-    patterns = []
-    with open('srd/srd-items.txt') as f:
-        for srditem in f.read().split('\n'):
-            if ':' in srditem:
-                old, new = srditem.split(':')
-                transforms[old.lower().strip()] = new.lower().strip()
-            elif '*' in srditem:
-                patterns.append(srditem.lower().strip())
-            else:
-                transforms[srditem.lower().strip()] = srditem.lower().strip()
-    found = set()
-
+    srd = get_srd('items')
     for item in data:
-        is_srd = False
-        item_name = item['name'].lower()
-        if item.get('source') not in ('PHB', 'DMG', None):
-            is_srd = False
-        elif item.get('source') == 'PHB' and not item.get('wondrous'):
-            is_srd = True
-            found.add(item_name)
-        else:
-            if item_name in transforms:
-                if transforms[item_name] == item_name:
-                    is_srd = True
-                    found.add(item_name)
-                else:
-                    new_item = copy.deepcopy(item)
-                    new_item['name'] = transforms[item_name].title()
-                    transforms[transforms[item_name]] = transforms[item_name]  # make sure we grab it
-                    data.append(new_item)
-
-            for pattern in patterns:
-                if fnmatch.fnmatch(item_name, pattern):
-                    log.info(f"{item_name} matches {pattern}")
-                    is_srd = True
-                    found.add(item_name)
-        item['srd'] = is_srd
-
-    not_found = [s for s in transforms if s not in found]
-    log.warning(f"These SRD items were not found: {', '.join(not_found)}")
+        renamed = srd_match(item, srd)
+        if renamed is not None:
+            data.append(renamed)
+    srd.report()
     return data
 
 
+def srd_match(item, srd):
+    """
+    Sets whether the item is in the SRD.
+    :returns A copy of the item under its SRD name, to be matched after every other item, or None if it is not renamed.
+    """
+    renamed = None
+    if item.get('source') not in ('PHB', 'DMG', None):
+        is_srd = False
+    elif item.get('source') == 'PHB' and not item.get('wondrous'):
+        srd.match(item['name'])  # counts as found
+        is_srd = True
+    else:
+        renamed = srd.renamed(item)
+        is_srd = srd.match(item['name'])
+    item['srd'] = is_srd
+    return renamed
+
+
 def prerender(data):
-    for item in data:
-        if 'entries' in item:
+    tag_stats = Counter()
+    for item in progress(data, "Rendering items"):
+        prerender_item(item, tag_stats)
+    log.info(f"Rendered leftover tags in {tag_stats['changed']} strings")
+    return data
+
+
+def prerender_item(item, tag_stats):
+    if 'entries' in item:
+        with metrics.timer('items.render', item['name']):
             item['desc'] = render(item['entries'])
-            del item['entries']
-        else:
-            item['desc'] = ""
+        del item['entries']
+    else:
+        item['desc'] = ""
 
-        # if 'additionalEntries' in item:
-        #     item['desc'] += f"\n\n{render(item['additionalEntries'])}"
-        item['desc'] = item['desc'].strip()
+    # if 'additionalEntries' in item:
+    #     item['desc'] += f"\n\n{render(item['additionalEntries'])}"
+    item['desc'] = item['desc'].strip()
 
-        for k, v in item.items():
-            item[k] = recursive_tag(v)
-    return data
+    for k, v in item.items():
+        item[k] = recursive_tag(v, tag_stats)
+    return item
 
 
 def site_render(data):
-    out = []
-    for item in data:
-        if not item['srd']:
-            continue
-
-        damage = ''
-        extras = ''
-        properties = []
-
-        if 'type' in item:
-            type_ = ', '.join(
-                i for i in ([ITEM_TYPES.get(t, 'n/a') for t in item['type'].split(',')] +
-                            ["Wondrous Item" if item.get('wondrous') else ''])
-                if i)
-            for iType in item['type'].split(','):
-                if iType in ('M', 'R', 'GUN'):
-                    damage = f"{item.get('dmg1', 'n/a')} {DMGTYPES.get(item.get('dmgType'), 'n/a')}" \
-                        if 'dmg1' in item and 'dmgType' in item else ''
-                    type_ += f', {item.get("weaponCategory")}'
-                if iType == 'S': damage = f"AC +{item.get('ac', 'n/a')}"
-                if iType == 'LA': damage = f"AC {item.get('ac', 'n/a')} + DEX"
-                if iType == 'MA': damage = f"AC {item.get('ac', 'n/a')} + DEX (Max 2)"
-                if iType == 'HA': damage = f"AC {item.get('ac', 'n/a')}"
-                if iType == 'SHP':  # ships
-                    extras = f"Speed: {item.get('speed')}\nCarrying Capacity: {item.get('carryingcapacity')}\n" \
-                        f"Crew {item.get('crew')}, AC {item.get('vehAc')}, HP {item.get('vehHp')}"
-                    if 'vehDmgThresh' in item:
-                        extras += f", Damage Threshold {item['vehDmgThresh']}"
-                if iType == 'siege weapon':
-                    extras = f"Size: {SIZES.get(item.get('size'), 'Unknown')}\n" \
-                        f"AC {item.get('ac')}, HP {item.get('hp')}\n" \
-                        f"Immunities: {item.get('immune')}"
+    return [site_render_item(item) for item in data if item['srd']]
+
+
+def site_render_item(item):
+    damage = ''
+    extras = ''
+    properties = []
+
+    if 'type' in item:
+        type_ = ', '.join(
+            i for i in ([ITEM_TYPES.get(t, 'n/a') for t in item['type'].split(',')] +
+                        ["Wondrous Item" if item.get('wondrous') else ''])
+            if i)
+        for iType in item['type'].split(','):
+            if iType in ('M', 'R', 'GUN'):
+                damage = f"{item.get('dmg1', 'n/a')} {DMGTYPES.get(item.get('dmgType'), 'n/a')}" \
+                    if 'dmg1' in item and 'dmgType' in item else ''
+                type_ += f', {item.get("weaponCategory")}'
+            if iType == 'S': damage = f"AC +{item.get('ac', 'n/a')}"
+            if iType == 'LA': damage = f"AC {item.get('ac', 'n/a')} + DEX"
+            if iType == 'MA': damage = f"AC {item.get('ac', 'n/a')} + DEX (Max 2)"
+            if iType == 'HA': damage = f"AC {item.get('ac', 'n/a')}"
+            if iType == 'SHP':  # ships
+                extras = f"Speed: {item.get('speed')}\nCarrying Capacity: {item.get('carryingcapacity')}\n" \
+                    f"Crew {item.get('crew')}, AC {item.get('vehAc')}, HP {item.get('vehHp')}"
+                if 'vehDmgThresh' in item:
+                    extras += f", Damage Threshold {item['vehDmgThresh']}"
+            if iType == 'siege weapon':
+                extras = f"Size: {SIZES.get(item.get('size'), 'Unknown')}\n" \
+                    f"AC {item.get('ac')}, HP {item.get('hp')}\n" \
+                    f"Immunities: {item.get('immune')}"
+    else:
+        type_ = ', '.join(
+            i for i in ("Wondrous Item" if item.get('wondrous') else '', item.get('technology')) if i)
+    rarity = str(item.get('rarity')).replace('None', '')
+    if 'tier' in item:
+        if rarity:
+            rarity += f', {item["tier"]}'
         else:
-            type_ = ', '.join(
-                i for i in ("Wondrous Item" if item.get('wondrous') else '', item.get('technology')) if i)
-        rarity = str(item.get('rarity')).replace('None', '')
-        if 'tier' in item:
-            if rarity:
-                rarity += f', {item["tier"]}'
-            else:
-                rarity = item['tier']
-        type_and_rarity = type_ + (f", {rarity}" if rarity else '')
-        value = (item.get('value', 'n/a') + (', ' if 'weight' in item else '')) if 'value' in item else ''
-        weight = (item.get('weight', 'n/a') + (' lb.' if item.get('weight') == '1' else ' lbs.')) \
-            if 'weight' in item else ''
-        weight_and_value = value + weight
-        for prop in item.get('property', []):
-            if not prop: continue
-            a = b = prop
-            a = PROPS.get(a, 'n/a')
-            if b == 'V': a += " (" + item.get('dmg2', 'n/a') + ")"
-            if b in ('T', 'A'): a += " (" + item.get('range', 'n/a') + "ft.)"
-            if b == 'RLD': a += " (" + item.get('reload', 'n/a') + " shots)"
-            properties.append(a)
-        properties = ', '.join(properties)
-        damage_and_properties = f"{damage} - {properties}" if properties else damage
-        damage_and_properties = (' --- ' + damage_and_properties) if weight_and_value and damage_and_properties else \
-            damage_and_properties
-
-        meta = f"*{type_and_rarity}*\n{weight_and_value}{damage_and_properties}\n{extras}"
-        text = item['desc']
-
-        out.append({'name': item['name'], 'meta': meta, 'desc': text})
-    return out
+            rarity = item['tier']
+    type_and_rarity = type_ + (f", {rarity}" if rarity else '')
+    value = (item.get('value', 'n/a') + (', ' if 'weight' in item else '')) if 'value' in item else ''
+    weight = (item.get('weight', 'n/a') + (' lb.' if item.get('weight') == '1' else ' lbs.')) \
+        if 'weight' in item else ''
+    weight_and_value = value + weight
+    for prop in item.get('property', []):
+        if not prop: continue
+        a = b = prop
+        a = PROPS.get(a, 'n/a')
+        if b == 'V': a += " (" + item.get('dmg2', 'n/a') + ")"
+        if b in ('T', 'A'): a += " (" + item.get('range', 'n/a') + "ft.)"
+        if b == 'RLD': a += " (" + item.get('reload', 'n/a') + " shots)"
+        properties.append(a)
+    properties = ', '.join(properties)
+    damage_and_properties = f"{damage} - {properties}" if properties else damage
+    damage_and_properties = (' --- ' + damage_and_properties) if weight_and_value and damage_and_properties else \
+        damage_and_properties
+
+    meta = f"*{type_and_rarity}*\n{weight_and_value}{damage_and_properties}\n{extras}"
+    text = item['desc']
+
+    return {'name': item['name'], 'meta': meta, 'desc': text}
+
+
+def stream_items():
+    """Yields the items and objects, ready for srdfilter(), reading one file at a time."""
+    for filename, key in ITEM_FILES:
+        yield from variant_inheritance(moneyfilter(get_data(filename)[key]))
+    yield from object_actions(get_objects())
+
+
+def build_streaming():
+    """
+    Builds the items as they are read, writing each one out once it is rendered, so that only one file's worth of
+    items is in memory at once. The outputs are the same as those of a normal run, or NDJSON with the "ndjson" flag.
+    :returns str - The file the SRD items were written to.
+    """
+    srd = get_srd('items')
+    tag_stats = Counter()
+    renamed = []
+    reporter = Progress("Streaming items", None)
+    with OutputWriter('items.json') as out, OutputWriter('template-items.json') as site_out, \
+            OutputWriter('srd-items.json') as srd_out:
+        def write(item):
+            prerender_item(item, tag_stats)
+            out.write(item)
+            if item['srd']:
+                site_out.write(site_render_item(item))
+                srd_out.write(item)
+            reporter.update()
+
+        for item in stream_items():
+            renamed_item = srd_match(item, srd)
+            if renamed_item is not None:
+                renamed.append(renamed_item)
+            write(item)
+        # the renamed copies share what they hold with the items they were made from, which rendering leaves as is
+        for item in renamed:
+            srd_match(item, srd)
+            write(item)
+    reporter.done()
+    srd.report()
+    log.info(f"Rendered leftover tags in {tag_stats['changed']} strings")
+    return srd_out.filename
 
 
 def run():
+    if STREAM:
+        diff(build_streaming())
+        metrics.dump('items')
+        return
+
     data = get_latest_items()
     data = moneyfilter(data)
     data = variant_inheritance(data)
@@ -216,7 +254,9 @@ def run():
     dump(sitedata, 'template-items.json')
     dump(srdonly(data), 'srd-items.json')
     diff('srd-items.json')
+    metrics.dump('items')
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+from collections import Counter
+
+MAX_VALUE_LEN = 80
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def _hash(value):
+    return hashlib.sha1(_canonical(value).encode()).hexdigest()
+
+
+def entity_key(entry):
+    """:returns str - The name and source identifying an entry, e.g. "Goblin (MM)"."""
+    if not isinstance(entry, dict):
+        return _canonical(entry)
+    if entry.get('source'):
+        return f"{entry.get('name')} ({entry['source']})"
+    return str(entry.get('name'))
+
+
+def _index(data):
+    """Maps each entry's key to the entry, numbering repeated keys so that none are lost."""
+    seen = Counter()
+    out = {}
+    for entry in data:
+        key = entity_key(entry)
+        seen[key] += 1
+        if seen[key] > 1:
+            key = f"{key} #{seen[key]}"
+        out[key] = entry
+    return out
+
+
+def _without_name(entry):
+    if not isinstance(entry, dict):
+        return entry
+    return {k: v for k, v in entry.items() if k != 'name'}
+
+
+def field_changes(old, new, path=''):
+    """
+    Finds the fields that differ between two values.
+    :returns list - A list of {"field", "old", "new"} dicts, with dotted paths to each changed field.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for k in old.keys() | new.keys():
+            sub = f"{path}.{k}" if path else str(k)
+            if k not in new:
+                changes.append({'field': sub, 'old': old[k], 'new': None})
+            elif k not in old:
+                changes.append({'field': sub, 'old': None, 'new': new[k]})
+            elif old[k] != new[k]:
+                changes.extend(field_changes(old[k], new[k], sub))
+        return sorted(changes, key=lambda c: c['field'])
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changes = []
+        for i, (o, n) in enumerate(zip(old, new)):
+            if o != n:
+                changes.extend(field_changes(o, n, f"{path}[{i}]"))
+        return changes
+    return [{'field': path, 'old': old, 'new': new}]
+
+
+def structural_diff(old, new):
+    """
+    Compares two lists of entities, keyed by name and source.
+    Every entry is hashed once, so the comparison is linear in the size of the data.
+    :returns dict - The changelog: added and removed keys, renamed {"from", "to"} pairs and changed
+                    {"key", "fields"} entries.
+    """
+    old_index = _index(old)
+    new_index = _index(new)
+    old_hashes = {k: _hash(v) for k, v in old_index.items()}
+    new_hashes = {k: _hash(v) for k, v in new_index.items()}
+
+    removed = [k for k in old_index if k not in new_index]
+    added = [k for k in new_index if k not in old_index]
+    changed = [{'key': k, 'fields': field_changes(old_index[k], new_index[k])}
+               for k in old_index if k in new_index and old_hashes[k] != new_hashes[k]]
+
+    # an entry that only lost its old key and gained a new one, with everything but the name intact, was renamed
+    added_by_content = {}
+    for k in added:
+        added_by_content.setdefault(_hash(_without_name(new_index[k])), []).append(k)
+    renamed = []
+    for k in removed:
+        candidates = added_by_content.get(_hash(_without_name(old_index[k])))
+        if candidates:
+            renamed.append({'from': k, 'to': candidates.pop(0)})
+    renamed_from = {r['from'] for r in renamed}
+    renamed_to = {r['to'] for r in renamed}
+
+    return {
+        'added': [k for k in added if k not in renamed_to],
+        'removed': [k for k in removed if k not in renamed_from],
+        'renamed': renamed,
+        'changed': changed
+    }
+
+
+def _short(value):
+    text = _canonical(value)
+    if len(text) > MAX_VALUE_LEN:
+        return text[:MAX_VALUE_LEN - 3] + '...'
+    return text
+
+
+def format_changelog(changelog, name=''):
+    """:returns str - A human-readable summary of a changelog from structural_diff()."""
+    lines = [f"{name}: {len(changelog['added'])} added, {len(changelog['removed'])} removed, "
+             f"{len(changelog['renamed'])} renamed, {len(changelog['changed'])} changed"]
+    lines.extend(f"+ {k}" for k in changelog['added'])
+    lines.extend(f"- {k}" for k in changelog['removed'])
+    lines.extend(f"~ {r['from']} -> {r['to']}" for r in changelog['renamed'])
+    for change in changelog['changed']:
+        lines.append(f"* {change['key']}")
+        lines.extend(f"    {c['field']}: {_short(c['old'])} -> {_short(c['new'])}" for c in change['fields'])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,177 @@
+import atexit
+import hashlib
+import logging
+import marshal
+import os
+import sqlite3
+from collections import OrderedDict
+
+# in-memory entries kept per cache; an sqlite file to also keep results across runs and scripts
+MEMO_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", 65536))
+MEMO_DB = os.environ.get("RENDER_CACHE")
+# hashing every input costs more than a cold run saves, so memoizing only pays off when asked for: with a disk layer
+# warmed by earlier runs, or data known to repeat itself
+ENABLED = MEMO_DB is not None or "RENDER_CACHE_SIZE" in os.environ
+FLUSH_EVERY = 1000
+
+log = logging.getLogger(__name__)
+
+_db = None
+_db_pid = None
+_caches = []
+
+
+def content_key(*values):
+    """
+    :returns bytes - A hash identifying JSON-like values by their content.
+    Format 0 of marshal writes every string the same way however it is shared or interned, unlike later formats.
+    """
+    return hashlib.sha1(marshal.dumps(values, 0)).digest()
+
+
+def _disk_key(key):
+    return hashlib.sha1(key.encode()).hexdigest() if isinstance(key, str) else key.hex()
+
+
+def get_db():
+    """Returns the connection to the on-disk memo layer, or None if RENDER_CACHE is not set."""
+    global _db, _db_pid
+    if MEMO_DB is None:
+        return None
+    if _db is None or _db_pid != os.getpid():  # sqlite connections must not cross a fork
+        _db = sqlite3.connect(MEMO_DB, timeout=30)
+        _db.execute("CREATE TABLE IF NOT EXISTS memo (cache TEXT, version TEXT, key TEXT, value TEXT, "
+                    "PRIMARY KEY (cache, key))")
+        _db_pid = os.getpid()
+    return _db
+
+
+class MemoCache:
+    """
+    A bounded LRU cache of function results, keyed on a string or on the content_key() of the arguments.
+    Results that fall out of memory, or were computed by an earlier run, are found again in the on-disk layer.
+    """
+
+    def __init__(self, name, version, maxsize=MEMO_SIZE):
+        """
+        :param name: The name the cache's entries are stored under on disk.
+        :param version: Stamp of the code producing the results; entries stored under another version are ignored.
+        :param maxsize: The number of entries kept in memory.
+        """
+        self.name = name
+        self.version = version
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        _caches.append(self)
+
+    def get(self, key):
+        """:returns The stored result, or None."""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            pass
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+        db = get_db()
+        if db is not None:
+            row = db.execute("SELECT value FROM memo WHERE cache = ? AND key = ? AND version = ?",
+                             (self.name, _disk_key(key), self.version)).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self._remember(key, row[0])
+                return row[0]
+        self.misses += 1
+        return None
+
+    def get_or_compute(self, key, func, *args):
+        """:returns The stored result for the key, computing and storing func(*args) if there is none."""
+        entries = self.entries
+        if key in entries:  # the common cases are inlined here, to keep the overhead on a miss low
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        value = self.get(key) if MEMO_DB is not None else None
+        if value is None:
+            if MEMO_DB is None:
+                self.misses += 1
+            value = func(*args)
+            self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        if MEMO_DB is not None:
+            self.pending[key] = value
+            if len(self.pending) >= FLUSH_EVERY:
+                self.flush()
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def flush(self):
+        """Writes results computed since the last flush to the on-disk layer."""
+        if not self.pending:
+            return
+        db = get_db()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)",
+                           ((self.name, self.version, _disk_key(k), v) for k, v in self.pending.items()))
+        self.pending.clear()
+
+    def clear(self, disk=True):
+        """Forgets every result, in memory and on disk, e.g. after the rendering rules changed."""
+        self.entries.clear()
+        self.pending.clear()
+        db = get_db()
+        if disk and db is not None:
+            with db:
+                db.execute("DELETE FROM memo WHERE cache = ?", (self.name,))
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.entries),
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0}
+
+
+def all_stats():
+    return {cache.name: cache.stats() for cache in _caches}
+
+
+def clear_all(disk=True):
+    for cache in _caches:
+        cache.clear(disk)
+
+
+def flush_all():
+    """Writes every cache's pending results to disk. Called at exit, and by worker processes when done."""
+    for cache in _caches:
+        cache.flush()
+
+
+def log_stats(reset=False):
+    """Logs each cache's hit rate, optionally starting the counts over, e.g. when a worker moves on to a new job."""
+    for cache in _caches:
+        stats = cache.stats()
+        if stats['hits'] + stats['disk_hits'] + stats['misses']:
+            log.info(f"{cache.name} cache: {stats['hits']} hits, {stats['disk_hits']} disk hits, "
+                     f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        if reset:
+            cache.hits = cache.disk_hits = cache.misses = 0
+
+
+@atexit.register
+def _on_exit():
+    flush_all()
+    log_stats()
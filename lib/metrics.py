@@ -0,0 +1,126 @@
+import heapq
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+from lib import memo
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "metrics")
+SLOW_SAMPLES = int(os.environ.get("METRICS_SLOW_SAMPLES", 20))
+
+log = logging.getLogger(__name__)
+
+
+class _Timer:
+    __slots__ = ('metrics', 'key', 'name', 'start')
+
+    def __init__(self, metrics, key, name=None):
+        self.metrics = metrics
+        self.key = key
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.key, time.perf_counter() - self.start, self.name)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Counters and timers for the hot paths of the pipelines. Work done while a result comes from the render cache is
+    not seen here, so the numbers describe what a run actually had to do.
+    Everything is a no-op unless enabled; code on a hot path should check `enabled` itself before building keys.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = Counter()
+        self.times = defaultdict(float)
+        self.slow = []  # heap of the slowest (seconds, key, name) seen
+
+    def count(self, key, n=1):
+        if self.enabled:
+            self.counters[key] += n
+
+    def timer(self, key, name=None):
+        """
+        :param key: What is being timed, e.g. "entry.table".
+        :param name: The entity being worked on, if any; the slowest ones are kept as samples.
+        :returns A context manager adding the time spent in it to the key.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, key, name)
+
+    def add_time(self, key, elapsed, name=None):
+        self.times[key] += elapsed
+        self.counters[key] += 1
+        if name is not None:
+            self._sample((elapsed, key, name))
+
+    def _sample(self, sample):
+        if len(self.slow) < SLOW_SAMPLES:
+            heapq.heappush(self.slow, sample)
+        elif sample > self.slow[0]:
+            heapq.heapreplace(self.slow, sample)
+
+    def report(self):
+        return {
+            'counters': dict(self.counters.most_common()),
+            'times': {k: round(v, 6) for k, v in sorted(self.times.items(), key=lambda t: t[1], reverse=True)},
+            'slowest': [{'key': key, 'name': name, 'seconds': round(elapsed, 6)}
+                        for elapsed, key, name in sorted(self.slow, reverse=True)],
+            'caches': memo.all_stats()
+        }
+
+    def export(self):
+        """:returns What was counted so far, for merge() in another process; the counts start over."""
+        state = (dict(self.counters), dict(self.times), list(self.slow))
+        self.reset()
+        return state
+
+    def merge(self, state):
+        """Adds what another process counted, as returned by its export()."""
+        counters, times, slow = state
+        self.counters.update(counters)
+        for key, elapsed in times.items():
+            self.times[key] += elapsed
+        for sample in slow:
+            self._sample(sample)
+
+    def reset(self):
+        self.counters.clear()
+        self.times.clear()
+        self.slow.clear()
+
+    def dump(self, name):
+        """Writes the report to METRICS_DIR/<name>.json and starts the counts over."""
+        if not self.enabled:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{name}.json")
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        log.info(f"Wrote metrics to {path}")
+        self.reset()
+
+
+metrics = Metrics(enabled="metrics" in sys.argv)
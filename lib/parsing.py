@@ -1,6 +1,10 @@
+import hashlib
 import logging
 import re
 
+from lib.memo import ENABLED as MEMO_ENABLED, MemoCache, content_key
+from lib.metrics import metrics
+
 log = logging.getLogger(__name__)
 
 ABILITY_MAP = {'str': 'Strength', 'dex': 'Dexterity', 'con': 'Constitution',
@@ -11,77 +15,203 @@ ATTACK_TYPES = {"M": "Melee", "R": "Ranged", "W": "Weapon", "S": "Spell"}
 def render(text, md_breaks=False, join_char='\n'):
     """Parses a list or string from data.
     :returns str - The final text."""
+    if isinstance(text, str):
+        return parse_data_formatting(text)
+    if RENDER_CACHE is None:
+        return _render(text, md_breaks, join_char)
+    return RENDER_CACHE.get_or_compute(content_key(text, md_breaks, join_char), _render, text, md_breaks, join_char)
+
+
+def _render(text, md_breaks=False, join_char='\n'):
+    out = []
+    render_into(text, out, f'{join_char}' if not md_breaks else f'  {join_char}')
+    return _parse_data_formatting(''.join(out))
+
+
+def render_into(text, out, join_str='\n'):
+    """
+    Writes a list or string from data into a buffer, leaving its tags to be parsed once the whole text is done.
+    :param text: The data to render.
+    :param out: The list the rendered pieces are appended to.
+    :param join_str: The separator between the rendered entries of a list.
+    """
     if isinstance(text, dict):
         text = [text]
     if not isinstance(text, list):
-        return parse_data_formatting(str(text))
-
-    out = []
-    join_str = f'{join_char}' if not md_breaks else f'  {join_char}'
+        out.append(str(text))
+        return
 
+    first = True
     for entry in text:
+        start = len(out)
+        if not first:
+            out.append(join_str)
         if not isinstance(entry, dict):
             out.append(str(entry))
-        elif isinstance(entry, dict):
-            if 'type' not in entry and 'title' in entry:
-                out.append(f"**{entry['title']}**: {render(entry['text'])}")
-            elif 'type' not in entry and 'istable' in entry:  # only for races
-                temp = f"**{entry['caption']}**\n" if 'caption' in entry else ''
-                temp += ' - '.join(f"**{parse_data_formatting(cl)}**" for cl in entry['thead']) + '\n'
-                for row in entry['tbody']:
-                    temp += ' - '.join(f"{parse_data_formatting(col)}" for col in row) + '\n'
-                out.append(temp.strip())
-            elif 'type' not in entry or entry['type'] in ('entries', 'inset'):
-                out.append((f"**{entry['name']}**: " if 'name' in entry else '') + render(
-                    entry['entries']))  # oh gods here we goooooooo
-            elif entry['type'] == 'options':
-                pass  # parsed separately in classfeat
-            elif entry['type'] == 'list':
-                out.append('\n'.join(f"- {render(t)}" for t in entry['items']))
-            elif entry['type'] == 'table':
-                temp = f"**{entry['caption']}**\n" if 'caption' in entry else ''
-                temp += ' - '.join(f"**{parse_data_formatting(cl)}**" for cl in entry['colLabels']) + '\n'
-                for row in entry['rows']:
-                    temp += ' - '.join(f"{render(col)}" for col in row) + '\n'
-                out.append(temp.strip())
-            elif entry['type'] == 'invocation':
-                pass  # this is only found in options
-            elif entry['type'] == 'abilityAttackMod':
-                out.append(f"`{entry['name']} Attack Bonus = "
-                           f"{' or '.join(ABILITY_MAP.get(a) for a in entry['attributes'])}"
-                           f" modifier + Proficiency Bonus`")
-            elif entry['type'] == 'abilityDc':
-                out.append(f"`{entry['name']} Save DC = 8 + "
-                           f"{' or '.join(ABILITY_MAP.get(a) for a in entry['attributes'])}"
-                           f" modifier + Proficiency Bonus`")
-            elif entry['type'] == 'bonus':
-                out.append("{:+}".format(entry['value']))
-            elif entry['type'] == 'dice':
-                out.append(f"{entry['number']}d{entry['faces']}")
-            elif entry['type'] == 'bonusSpeed':
-                out.append(f"{entry['value']} feet")
-            elif entry['type'] == 'actions':
-                out.append((f"**{entry['name']}**: " if 'name' in entry else '') + render(entry['entries']))
-            elif entry['type'] == 'attack':
-                out.append(f"{' '.join(ATTACK_TYPES.get(t) for t in entry['attackType'])} Attack: "
-                           f"{render(entry['attackEntries'])} Hit: {render(entry['hitEntries'])}")
-            elif entry['type'] == 'item':
-                out.append(f"*{entry['name']}* {render(entry['entry'])}")
-            elif entry['type'] == 'cell':
-                if 'entry' in entry:
-                    out.append(render(entry['entry']))
-                else:
-                    if 'exact' in entry['roll']:
-                        out.append(str(entry['roll']['exact']))
-                    else:
-                        out.append(f"{str(entry['roll']['min'])} - {str(entry['roll']['max'])}")
+        else:
+            if 'type' in entry:
+                handler = ENTRY_TYPES.get(entry['type'])
+            elif 'title' in entry:
+                handler = _render_titled
+            elif 'istable' in entry:
+                handler = _render_races_table
             else:
-                log.warning(f"Missing data entry type parse: {entry}")
+                handler = _render_entries
+            if handler is None:
+                _warn_once('entry', entry.get('type'), "Missing data entry type parse: %s", entry)
+                rendered = False
+            elif metrics.enabled:
+                with metrics.timer(f"entry.{entry.get('type', handler.__name__)}"):
+                    rendered = handler(entry, out)
+            else:
+                rendered = handler(entry, out)
+            if rendered is False:
+                del out[start:]  # the entry is left out, separator and all
+                continue
+        first = False
+
+
+_warned = set()
+
+
+def _warn_once(kind, key, message, *args):
+    """
+    Warns about the first unknown tag or entry type of each name; the rest are only counted.
+    The message is a %-format of args, so that it is only formatted for the one that is logged.
+    """
+    if metrics.enabled:
+        metrics.count(f"unknown_{kind}.{key}")
+    if (kind, key) not in _warned:
+        _warned.add((kind, key))
+        log.warning(f"{message} (further ones are not logged)", *args)
+
+
+ENTRY_TYPES = {}
+
+
+def register_entry_type(*types):
+    """
+    Registers the decorated function as the renderer of data entries of the given types, replacing any earlier one.
+    The function takes the entry and the output buffer, and appends its text to the buffer (see render_into). If it
+    returns False, the entry is left out of the text entirely.
+    """
+
+    def decorator(func):
+        for t in types:
+            ENTRY_TYPES[t] = func
+        if func.__module__ != __name__ and RENDER_CACHE is not None:
+            # results rendered without this handler are stale, on disk too
+            RENDER_CACHE.version = content_key(RENDER_CACHE.version, func.__module__, func.__qualname__, types).hex()
+            RENDER_CACHE.clear(disk=False)
+        return func
+
+    return decorator
+
+
+def _render_row(cells, out, label=False):
+    for i, cell in enumerate(cells):
+        if i:
+            out.append(' - ')
+        if label:
+            out.append('**')
+        render_into(cell, out)
+        if label:
+            out.append('**')
+    out.append('\n')
+
+
+def _render_titled(entry, out):
+    out.append(f"**{entry['title']}**: ")
+    render_into(entry['text'], out)
+
+
+def _render_table_body(entry, labels, rows, out):
+    temp = [f"**{entry['caption']}**\n"] if 'caption' in entry else []
+    _render_row(labels, temp, label=True)
+    for row in rows:
+        _render_row(row, temp)
+    out.append(_parse_data_formatting(''.join(temp)).strip())  # as rendered, a cell may end in whitespace
+
+
+def _render_races_table(entry, out):  # only for races
+    _render_table_body(entry, entry['thead'], entry['tbody'], out)
+
+
+@register_entry_type('entries', 'inset', 'actions')
+def _render_entries(entry, out):
+    if 'name' in entry:
+        out.append(f"**{entry['name']}**: ")
+    render_into(entry['entries'], out)  # oh gods here we goooooooo
+
+
+@register_entry_type('options', 'invocation')
+def _render_nothing(entry, out):
+    return False  # options are parsed separately in classfeat, and invocations are only found in options
+
+
+@register_entry_type('list')
+def _render_list(entry, out):
+    for i, item in enumerate(entry['items']):
+        out.append('\n- ' if i else '- ')
+        render_into(item, out)
 
-        else:
-            log.warning(f"Unknown data entry: {entry}")
 
-    return parse_data_formatting(join_str.join(out))
+@register_entry_type('table')
+def _render_table(entry, out):
+    _render_table_body(entry, entry['colLabels'], entry['rows'], out)
+
+
+@register_entry_type('abilityAttackMod')
+def _render_ability_attack_mod(entry, out):
+    out.append(f"`{entry['name']} Attack Bonus = "
+               f"{' or '.join(ABILITY_MAP.get(a) for a in entry['attributes'])}"
+               f" modifier + Proficiency Bonus`")
+
+
+@register_entry_type('abilityDc')
+def _render_ability_dc(entry, out):
+    out.append(f"`{entry['name']} Save DC = 8 + "
+               f"{' or '.join(ABILITY_MAP.get(a) for a in entry['attributes'])}"
+               f" modifier + Proficiency Bonus`")
+
+
+@register_entry_type('bonus')
+def _render_bonus(entry, out):
+    out.append("{:+}".format(entry['value']))
+
+
+@register_entry_type('dice')
+def _render_dice(entry, out):
+    out.append(f"{entry['number']}d{entry['faces']}")
+
+
+@register_entry_type('bonusSpeed')
+def _render_bonus_speed(entry, out):
+    out.append(f"{entry['value']} feet")
+
+
+@register_entry_type('attack')
+def _render_attack(entry, out):
+    out.append(f"{' '.join(ATTACK_TYPES.get(t) for t in entry['attackType'])} Attack: ")
+    render_into(entry['attackEntries'], out)
+    out.append(" Hit: ")
+    render_into(entry['hitEntries'], out)
+
+
+@register_entry_type('item')
+def _render_item(entry, out):
+    out.append(f"*{entry['name']}* ")
+    render_into(entry['entry'], out)
+
+
+@register_entry_type('cell')
+def _render_cell(entry, out):
+    if 'entry' in entry:
+        render_into(entry['entry'], out)
+    elif 'exact' in entry['roll']:
+        out.append(str(entry['roll']['exact']))
+    else:
+        out.append(f"{str(entry['roll']['min'])} - {str(entry['roll']['max'])}")
 
 
 def SRC_FORMAT(e):
@@ -106,41 +236,145 @@ DEFAULT = ['condition', 'skill', 'action', 'creature', 'item', 'spell', 'damage'
            'class', 'table', 'sense']
 
 
+# a whole tag with no braces inside it, the opener of a tag that has some ("{@name "), or any other brace
+TAG_TOKEN_RE = re.compile(r'{@(\w+)(?: ([^{}]+))?}|{@(\w+)(?: |(?=}))|[{}]')
+
+
+def _render_tag(name, arg, raw):
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
+        log.debug(f"Rendering {raw}...")
+    if name in FORMATTING:
+        f = FORMATTING.get(name, '')
+        out = f"{f}{arg}{f}"
+    elif name in PARSING:
+        f = PARSING.get(name, lambda e: e)
+        out = f(arg)
+    else:
+        out = SRC_FORMAT(arg)
+        if name not in DEFAULT:
+            _warn_once('tag', name, "Possible unknown tag: %s", raw)
+    if debug:
+        log.debug(f"Replaced with {out}")
+    return out
+
+
+def _render_tag_timed(name, arg, raw):
+    with metrics.timer(f"tag.{name}"):
+        return _render_tag(name, arg, raw)
+
+
+def _render_tags(text):
+    """
+    Renders every tag in one left-to-right scan, innermost first.
+    A tag is only rendered if its argument, once its own tags are rendered, holds no braces - exactly the tags the
+    pattern {@(\w+)(?: ([^{}]+?))?} would eventually match. Anything else is kept as it was written.
+    :returns tuple (str, bool) - The text, and whether any tag was rendered.
+    """
+    root = []
+    parts = root
+    stack = []  # open tags, as [name, has_arg, parts, valid]
+    rendered = False
+    render_tag = _render_tag_timed if metrics.enabled else _render_tag
+    pos = 0
+    for match in TAG_TOKEN_RE.finditer(text):
+        start, end = match.span()
+        if start > pos:
+            parts.append(text[pos:start])
+        pos = end
+        name, arg, opener = match.groups()
+
+        if name is not None:
+            parts.append(render_tag(name, arg, match.group()))
+            rendered = True
+        elif opener is not None:
+            parts = []
+            stack.append([opener, text[end - 1] == ' ', parts, True])
+        elif text[start] == '{' or not stack:
+            parts.append(text[start])
+            if stack:
+                stack[-1][3] = False
+        else:
+            name, has_arg, tag_parts, valid = stack.pop()
+            parts = stack[-1][2] if stack else root
+            arg = ''.join(tag_parts)
+            raw = f"{{@{name}{' ' if has_arg else ''}{arg}}}"
+            if valid and (arg or not has_arg):
+                parts.append(render_tag(name, arg if has_arg else None, raw))
+                rendered = True
+            else:
+                parts.append(raw)
+                if stack:
+                    stack[-1][3] = False
+    if pos < len(text):
+        parts.append(text[pos:])
+
+    while stack:  # unclosed tags stay as written
+        name, has_arg, tag_parts, _ = stack.pop()
+        parts = stack[-1][2] if stack else root
+        parts.append(f"{{@{name}{' ' if has_arg else ''}{''.join(tag_parts)}")
+    return ''.join(root), rendered
+
+
 def parse_data_formatting(text):
     """Parses a {@format } string."""
-    exp = re.compile(r'{@(\w+)(?: ([^{}]+?))?}')
-
-    def sub(match):
-        log.debug(f"Rendering {match.group(0)}...")
-        if match.group(1) in FORMATTING:
-            f = FORMATTING.get(match.group(1), '')
-            out = f"{f}{match.group(2)}{f}"
-        elif match.group(1) in PARSING:
-            f = PARSING.get(match.group(1), lambda e: e)
-            out = f(match.group(2))
-        else:
-            out = SRC_FORMAT(match.group(2))
-            if not match.group(1) in DEFAULT:
-                log.warning(f"Possible unknown tag: {match.group(0)}")
-        log.debug(f"Replaced with {out}")
-        return out
+    if '{@' not in text:
+        return text
+    if FORMATTING_CACHE is None:
+        return _parse_data_formatting(text)
+    return FORMATTING_CACHE.get_or_compute(text, _parse_data_formatting, text)
 
-    while exp.search(text):
-        text = exp.sub(sub, text)
+
+def _parse_data_formatting(text):
+    while '{@' in text:
+        text, rendered = _render_tags(text)
+        # a rendered tag can only complete a new one in contrived text like "{@{@spell b} x}"
+        if not rendered:
+            break
     return text
 
 
-def recursive_tag(value):
+# rendered text only depends on this module, so a change to it invalidates anything cached on disk
+with open(__file__, 'rb') as _f:
+    VERSION = hashlib.sha1(_f.read()).hexdigest()
+# None unless RENDER_CACHE or RENDER_CACHE_SIZE is set (see lib.memo)
+RENDER_CACHE = MemoCache('render', VERSION) if MEMO_ENABLED else None
+FORMATTING_CACHE = MemoCache('parse_data_formatting', VERSION) if MEMO_ENABLED else None
+
+
+def recursive_tag(value, stats=None):
     """
-    Recursively renders all tags.
+    Recursively renders all tags, in place. Only strings that still hold a tag are rendered, so running it over data
+    that is already rendered just walks it.
     :param value: The object to render tags from.
+    :param stats: A Counter to add the number of strings that held a tag ('tagged') and were changed ('changed') to.
     :return: The object, with all tags rendered.
     """
+    counts = [0, 0]
     if isinstance(value, str):
-        return render(value)
-    if isinstance(value, list):
-        return [recursive_tag(i) for i in value]
-    if isinstance(value, dict):
-        for k, v in value.items():
-            value[k] = recursive_tag(v)
+        value = _tag_string(value, counts)
+    elif isinstance(value, (list, dict)):
+        _tag_children(value, counts)
+    if stats is not None:
+        stats['tagged'] += counts[0]
+        stats['changed'] += counts[1]
     return value
+
+
+def _tag_string(value, counts):
+    if '{@' not in value:
+        return value
+    counts[0] += 1
+    out = parse_data_formatting(value)
+    if out != value:
+        counts[1] += 1
+    return out
+
+
+def _tag_children(value, counts):
+    for k, v in (enumerate(value) if isinstance(value, list) else value.items()):
+        if isinstance(v, str):
+            if '{@' in v:
+                value[k] = _tag_string(v, counts)
+        elif isinstance(v, (list, dict)):
+            _tag_children(v, counts)
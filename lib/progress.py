@@ -0,0 +1,56 @@
+import logging
+import os
+import time
+
+# seconds between progress lines of a running stage
+PROGRESS_INTERVAL = float(os.environ.get("PROGRESS_INTERVAL", 5))
+
+log = logging.getLogger(__name__)
+
+
+class Progress:
+    """
+    Reports how far a stage over many entities has got: a progress line every PROGRESS_INTERVAL seconds while it runs,
+    and a summary of the count, time taken and rate when it is done. Per-entity detail belongs at DEBUG.
+    """
+
+    def __init__(self, stage, total=None):
+        """
+        :param stage: What is being done, e.g. "Rendering monsters".
+        :param total: The number of entities the stage will see, if known.
+        """
+        self.stage = stage
+        self.total = total
+        self.count = 0
+        self.start = self.last = time.perf_counter()
+
+    def update(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if now - self.last >= PROGRESS_INTERVAL:
+            self.last = now
+            of_total = f"/{self.total}" if self.total is not None else ''
+            log.info(f"{self.stage}: {self.count}{of_total} ({self._rate(now):.0f}/s, {now - self.start:.1f}s)")
+
+    def done(self):
+        now = time.perf_counter()
+        log.info(f"{self.stage}: {self.count} done in {now - self.start:.2f}s ({self._rate(now):.0f}/s)")
+
+    def _rate(self, now):
+        return self.count / (now - self.start) if now > self.start else 0
+
+
+def progress(items, stage, total=None):
+    """
+    Iterates over items, reporting progress on them as a stage.
+    :param items: The entities to iterate over.
+    :param stage: What is being done with them.
+    :param total: The number of items; taken from len(items) if not given.
+    """
+    if total is None and hasattr(items, '__len__'):
+        total = len(items)
+    reporter = Progress(stage, total)
+    for item in items:
+        yield item
+        reporter.update()
+    reporter.done()
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import re
+import shutil
+
+from lib.utils import MINIFY, NDJSON, OutputWriter, Spill, load_output
+
+MANIFEST = 'manifest.json'
+
+log = logging.getLogger(__name__)
+
+
+def shard_name(*parts):
+    """:returns str - The parts as a path of a shard, with anything that could escape the directory replaced."""
+    return '/'.join(re.sub(r'[^\w\-]', '_', str(part)) for part in parts)
+
+
+class ShardedOutput:
+    """
+    Writes entities to shards in out/<name>/, each entity to the shard its shard_of() names, alongside a manifest of
+    where in which shard each one is, by name:
+    {"shards": [paths, relative to out/<name>/], "entries": {name: [[shard, offset, length], ...]}}
+    The offset and length are in bytes, so that one entity can be read without parsing the rest of its shard.
+    Like OutputWriter, the whole directory is only put in place, the previous one moved to bak/, on close().
+    Entities are set aside in a Spill until then and written a shard at a time, so that only one file is open however
+    many shards there are.
+    """
+
+    def __init__(self, name, shard_of, minify=MINIFY, ndjson=NDJSON):
+        """
+        :param name: The directory of the output, e.g. "bestiary".
+        :param shard_of: A function giving the shard of an entity, a path like those of shard_name().
+        :param minify: Whether to write compact JSON instead of indenting it. Defaults to the "minify" flag.
+        :param ndjson: Whether to write the shards as NDJSON. Defaults to the "ndjson" flag.
+        """
+        self.name = name
+        self.shard_of = shard_of
+        self.minify = minify
+        self.ndjson = ndjson
+        self.shards = []
+        self.entries = {}
+        self._spill = Spill()
+        self._pending = {}  # shard -> [(spill handle, its [shard, offset, length] in entries)]
+        self._tmp = f'{name}.tmp'
+        shutil.rmtree(f'out/{self._tmp}', ignore_errors=True)  # left over by a crash
+
+    def write(self, entity):
+        shard = self.shard_of(entity)
+        location = [None, None, None]  # filled in when the shard is written
+        self.entries.setdefault(entity['name'], []).append(location)
+        self._pending.setdefault(shard, []).append((self._spill.add(entity), location))
+
+    def close(self):
+        with self._spill:
+            for shard, pending in self._pending.items():
+                os.makedirs(os.path.dirname(f'out/{self._tmp}/{shard}'), exist_ok=True)
+                with OutputWriter(f'{self._tmp}/{shard}.json', self.minify, self.ndjson) as writer:
+                    i = len(self.shards)
+                    self.shards.append(writer.filename[len(self._tmp) + 1:])
+                    for handle, location in pending:
+                        location[:] = [i, *writer.write(self._spill.get(handle))]
+        with open(f'out/{self._tmp}/{MANIFEST}', 'w') as f:
+            json.dump({'shards': self.shards, 'entries': self.entries}, f, separators=(',', ':'))
+        if os.path.exists(f'out/{self.name}'):
+            shutil.rmtree(f'bak/{self.name}.old', ignore_errors=True)
+            os.replace(f'out/{self.name}', f'bak/{self.name}.old')
+        os.replace(f'out/{self._tmp}', f'out/{self.name}')
+        count = sum(map(len, self.entries.values()))
+        log.info(f"Wrote {count} entries to {len(self.shards)} shards in out/{self.name}")
+
+    def discard(self):
+        self._spill.close()
+        shutil.rmtree(f'out/{self._tmp}', ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class Shards:
+    """
+    Reads the output of ShardedOutput, loading only the manifest up front, and then just the entities or shards asked
+    for. Names are looked up case-insensitively.
+    """
+
+    def __init__(self, path):
+        """:param path: The directory of the output, e.g. "out/bestiary"."""
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.shards = manifest['shards']
+        self.entries = {}
+        for name, locations in manifest['entries'].items():
+            self.entries.setdefault(name.lower(), []).extend(locations)
+
+    def locate(self, name):
+        """:returns list - (shard, offset, length) of each entity of the name, in the order they were written."""
+        return [(self.shards[i], offset, length) for i, offset, length in self.entries.get(name.lower(), [])]
+
+    def get(self, name):
+        """:returns list - Every entity of the name, read from its shard without loading the rest of it."""
+        out = []
+        for shard, offset, length in self.locate(name):
+            with open(os.path.join(self.path, shard), 'rb') as f:
+                f.seek(offset)
+                out.append(json.loads(f.read(length)))
+        return out
+
+    def load_shard(self, shard):
+        """:returns list - Every entity in a shard, e.g. "MM/cr0-4.json"."""
+        return load_output(os.path.join(self.path, shard))
+
+    def __contains__(self, name):
+        return name.lower() in self.entries
@@ -0,0 +1,99 @@
+import fnmatch
+import logging
+import re
+
+SRD_DIR = 'srd'
+
+log = logging.getLogger(__name__)
+
+_lists = {}
+
+
+class SRDList:
+    """
+    The names in one srd/srd-<kind>.txt, compiled for lookups: plain names into a set, "Old Name:SRD Name" lines into a
+    map of renames, and every wildcard line into a single regex. Names are matched case-insensitively.
+    Remembers which names were matched, so what the data did not contain can be reported once filtering is done.
+    """
+
+    def __init__(self, kind, lines):
+        """
+        :param kind: What the list names, e.g. "monsters"; used in the report.
+        :param lines: The lines of the list. Blank lines and "Challenge X" headers are skipped.
+        """
+        self.kind = kind
+        self.names = set()
+        self.renames = {}
+        self.patterns = []
+        self.found = set()
+        self.matched_patterns = set()
+        for line in lines:
+            line = line.strip().lower()
+            if not line or line.startswith('challenge '):
+                continue
+            if ':' in line:
+                old, new = line.split(':')
+                self.renames[old.strip()] = new.strip()
+            elif '*' in line:
+                self.patterns.append(line)
+            else:
+                self.names.add(line)
+        self.expected = self.names | set(self.renames.values())
+        # each pattern gets a named group of its own, so a match tells which one it was
+        self._pattern_re = re.compile('|'.join(f"(?P<p{i}>{fnmatch.translate(p)})"
+                                               for i, p in enumerate(self.patterns))) if self.patterns else None
+
+    def match(self, name):
+        """:returns bool - Whether the name is in the SRD, by name or by pattern."""
+        name = name.lower()
+        if name in self.names:
+            self.found.add(name)
+            return True
+        if self._pattern_re is not None:
+            m = self._pattern_re.match(name)
+            if m is not None:
+                log.debug(f"{name} matches {self.patterns[int(m.lastgroup[1:])]}")
+                self.matched_patterns.add(m.lastgroup)
+                self.found.add(name)
+                return True
+        return False
+
+    def renamed(self, entity):
+        """
+        :param entity: A dict with a name, which the SRD may publish under another name.
+        :returns A shallow copy of the entity under its SRD name, or None if it is not renamed.
+        The copy shares nested values with the original, so both must only be changed in ways that are safe to repeat.
+        """
+        new_name = self.renames.get(entity['name'].lower())
+        if new_name is None:
+            return None
+        self.names.add(new_name)  # make sure we grab it
+        renamed = dict(entity)
+        renamed['name'] = new_name.title()
+        return renamed
+
+    def report(self):
+        """Logs how many names matched, and warns about the SRD names and patterns that matched nothing."""
+        not_found = sorted(self.expected - self.found)
+        unused = [p for i, p in enumerate(self.patterns) if f"p{i}" not in self.matched_patterns]
+        log.info(f"Matched {len(self.found)} SRD {self.kind}")
+        if not_found:
+            log.warning(f"These SRD {self.kind} were not found: {', '.join(not_found)}")
+        if unused:
+            log.warning(f"These SRD {self.kind} patterns matched nothing: {', '.join(unused)}")
+
+
+def get_srd(kind):
+    """
+    :param kind: The list to load, e.g. "items" for srd/srd-items.txt.
+    :returns SRDList - The list, read and compiled once per process. Found names are kept across calls until reset().
+    """
+    if kind not in _lists:
+        with open(f'{SRD_DIR}/srd-{kind}.txt') as f:
+            _lists[kind] = SRDList(kind, f.read().split('\n'))
+    return _lists[kind]
+
+
+def reset():
+    """Forgets the loaded lists, and what was found in them."""
+    _lists.clear()
@@ -1,85 +1,547 @@
-import difflib
+import hashlib
 import json
 import logging
+import marshal
 import os
+import re
 import sys
+import tempfile
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from lib.changelog import format_changelog, structural_diff
 
 DATA_SRC = os.environ.get("DATA_SRC")
+FROM_SNAPSHOT = DATA_SRC is not None and DATA_SRC.endswith('.zip')
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 8))
+REVALIDATE = "revalidate" in sys.argv
+UPDATE = "update" in sys.argv
+BINARY_CACHE = "jsoncache" not in sys.argv
+CACHE_COMPRESS = bool(os.environ.get("CACHE_COMPRESS"))
+MINIFY = "minify" in sys.argv
+STREAM = "stream" in sys.argv
+NDJSON = "ndjson" in sys.argv
+SPELL_AUTOMATION_SRC = os.environ.get("SPELL_AUTOMATION_SRC",
+                                      "https://raw.githubusercontent.com/avrae/avrae-spells/master/spells.json")
+# every file the datasets are built from, flat files (relative to DATA_SRC, or absolute URLs) and index roots (with the
+# key of their entry lists)
+DATA_FILES = ('items.json', 'basicitems.json', 'magicvariants.json', 'objects.json', 'races.json', 'feats.json',
+              'backgrounds.json', 'names.json', 'optionalfeatures.json', SPELL_AUTOMATION_SRC)
+INDEXED_DATA = {'bestiary/': 'monster', 'spells/': 'spell', 'class/': 'class'}
+CACHE_MAGIC = b'AVRC'
+CACHE_FORMAT_VERSION = 1
 LOGLEVEL = logging.INFO if "debug" not in sys.argv else logging.DEBUG
 
-log_formatter = logging.Formatter('%(levelname)s:%(name)s: %(message)s')
-handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(log_formatter)
-logger = logging.getLogger()
-logger.setLevel(LOGLEVEL)
-logger.addHandler(handler)
 log = logging.getLogger(__name__)
 
+_logging_set_up = False
+_session = None
+_snapshot = None
+
+
+def setup_logging():
+    """
+    Sends log records to stdout, at DEBUG with the "debug" flag and INFO otherwise.
+    Called by each script when it is run, so that merely importing the library leaves logging alone.
+    """
+    global _logging_set_up
+    if _logging_set_up:  # e.g. in a forked worker
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s: %(message)s'))
+    logger = logging.getLogger()
+    logger.setLevel(LOGLEVEL)
+    logger.addHandler(handler)
+    _logging_set_up = True
+
+
+def get_session():
+    """Returns the shared HTTP session, so that every fetch reuses pooled connections."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(FETCH_WORKERS, 1))
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def get_snapshot():
+    """Returns the snapshot archive DATA_SRC points to, opened once for random access to its members."""
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = zipfile.ZipFile(DATA_SRC)
+    return _snapshot
+
+
+def local_path(path):
+    """
+    :param path: A path relative to DATA_SRC, or an absolute URL.
+    :returns str - Where the path is kept in the cache and in snapshots: as it is if relative, or under the host of
+    the URL otherwise.
+    """
+    url = urlsplit(path)
+    if not url.scheme:
+        return path
+    host = re.sub(r'[^\w.-]', '_', url.netloc)  # e.g. the colon before a port
+    return f"{host}{url.path}"
+
+
+def _url(path):
+    return path if urlsplit(path).scheme else DATA_SRC + path
+
 
 def get_json(path):
+    """:param path: A path relative to DATA_SRC, or an absolute URL."""
+    if FROM_SNAPSHOT:
+        log.info(f"Reading {path} from snapshot...")
+        with get_snapshot().open(local_path(path)) as f:
+            return json.load(f)
     log.info(f"Getting {path}...")
-    return requests.get(DATA_SRC + path).json()
+    resp = get_session().get(_url(path))
+    resp.raise_for_status()  # names the URL, rather than failing to decode an error page
+    return resp.json()
+
+
+def get_many_json(paths, workers=FETCH_WORKERS):
+    """
+    Fetches several paths using a bounded pool of worker threads.
+    :param paths: The paths to fetch, relative to DATA_SRC.
+    :param workers: The maximum number of requests in flight at once. 1 fetches serially.
+    :return: The decoded JSON of each path, in the same order as paths.
+    """
+    return _pool_map(get_json, paths, workers)
+
+
+def iter_many_json(paths, workers=FETCH_WORKERS):
+    """Like get_many_json(), but yields the decoded JSON of each path in order as it arrives, holding only a few."""
+    return _pool_imap(get_json, paths, workers)
+
+
+def _pool_map(func, items, workers):
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
+
+def _pool_imap(func, items, workers):
+    """Like _pool_map(), but yields the results in order, with no more than workers of them fetched ahead."""
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _load_validators(cache_path):
+    try:
+        with open(f'{cache_path}.meta') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def get_revalidated(path, cache_path):
+    """
+    Fetches a path, storing its ETag/Last-Modified next to the cached copy and sending them back as a conditional GET.
+    :param path: The path to fetch, relative to DATA_SRC, or an absolute URL.
+    :param cache_path: Where the cached copy of the path lives.
+    :return: (data, changed) - changed is False if the server answered 304 and the cached copy was reused.
+    """
+    headers = {}
+    if "nocache" not in sys.argv and os.path.exists(cache_path):
+        validators = _load_validators(cache_path)
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    log.info(f"Getting {path}{' (conditional)' if headers else ''}...")
+    resp = get_session().get(_url(path), headers=headers)
+    if resp.status_code == 304:
+        dat = load_cache(cache_path)
+        log.info(f"{path} not modified, loaded from cache")
+        return dat, False
+    resp.raise_for_status()
+
+    dat = resp.json()
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    write_cache(cache_path, dat)
+    validators = {}
+    if 'ETag' in resp.headers:
+        validators['etag'] = resp.headers['ETag']
+    if 'Last-Modified' in resp.headers:
+        validators['last_modified'] = resp.headers['Last-Modified']
+    with open(f'{cache_path}.meta', 'w') as f:
+        json.dump(validators, f)
+    return dat, True
+
+
+def _cache_header(digest, compressed):
+    return CACHE_MAGIC + bytes([CACHE_FORMAT_VERSION, marshal.version, compressed]) + digest
+
+
+def _write_binary_cache(cache_path, dat, digest):
+    payload = marshal.dumps(dat)
+    if CACHE_COMPRESS:
+        payload = zlib.compress(payload, 1)
+    tmp = f'{cache_path}.bin.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_cache_header(digest, CACHE_COMPRESS))
+        f.write(payload)
+    os.replace(tmp, f'{cache_path}.bin')  # a killed run never leaves a current header on a truncated payload
+
+
+def write_cache(cache_path, dat):
+    """Writes data to the JSON cache, plus a binary copy stamped with the hash of that JSON."""
+    raw = json.dumps(dat, indent=2).encode()
+    with open(cache_path, 'wb') as f:
+        f.write(raw)
+    if BINARY_CACHE:
+        _write_binary_cache(cache_path, dat, hashlib.sha1(raw).digest())
+
+
+def load_cache(cache_path):
+    """
+    Loads a cached JSON file.
+    If its binary copy carries the current format version and the hash of the JSON on disk, that copy is loaded
+    instead of parsing the JSON; otherwise the JSON is parsed and the binary copy rewritten.
+    :raises FileNotFoundError: if nothing is cached at cache_path.
+    """
+    with open(cache_path, 'rb') as f:
+        raw = f.read()
+    if not BINARY_CACHE:
+        return json.loads(raw)
+
+    digest = hashlib.sha1(raw).digest()
+    try:
+        with open(f'{cache_path}.bin', 'rb') as f:
+            header = f.read(len(_cache_header(digest, False)))
+            if header in (_cache_header(digest, False), _cache_header(digest, True)):
+                payload = f.read()
+                return marshal.loads(zlib.decompress(payload) if header[6] else payload)
+    except FileNotFoundError:
+        pass
+    except (EOFError, ValueError, TypeError, zlib.error) as e:
+        log.warning(f"Binary cache for {cache_path} is corrupt ({type(e).__name__}: {e}), rebuilding it")
+    log.debug(f"Binary cache for {cache_path} is missing or stale")
+    dat = json.loads(raw)
+    _write_binary_cache(cache_path, dat, digest)
+    return dat
 
 
 def get_data(path):
+    if FROM_SNAPSHOT:
+        return get_json(path)
+    if REVALIDATE:
+        return get_revalidated(path, f'cache/{local_path(path)}')[0]
     try:
         if "nocache" not in sys.argv:
-            with open(f'cache/{path}') as f:
-                dat = json.load(f)
-                log.info(f"Loaded {path} from cache")
+            dat = load_cache(f'cache/{local_path(path)}')
+            log.info(f"Loaded {path} from cache")
         else:
             raise FileNotFoundError  # I mean.
     except FileNotFoundError:
-        dat = get_json(path)
-        with open(f'cache/{path}', 'w') as f:
-            json.dump(dat, f, indent=2)
+        dat, _ = get_revalidated(path, f'cache/{local_path(path)}')
     return dat
 
 
-def get_indexed_data(root, cache_name, root_key):
+def _index_entry_hash(src, file):
+    return hashlib.sha1(json.dumps([src, file]).encode()).hexdigest()
+
+
+def _load_manifest(root):
     try:
-        if "nocache" not in sys.argv:
-            with open(f'cache/{cache_name}') as f:
-                cached = json.load(f)
-                log.info(f"Loaded {cache_name} data from cache")
-                return cached
-        else:
-            raise FileNotFoundError
-    except FileNotFoundError:
-        index = get_json(f'{root}index.json')
+        with open(f'cache/{root}manifest.json') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _indexed_loader(root):
+    """
+    :returns (sources, load, cached) - The index entries of the files under root, a function getting the data of one
+    of them, and whether that is all read from the cache, so that there is no manifest to write.
+    """
+    if FROM_SNAPSHOT:
+        sources = index_sources(get_json(f'{root}index.json'))
+        return sources, lambda source: get_json(f"{root}{source['file']}"), False
+
+    manifest = _load_manifest(root) if "nocache" not in sys.argv else None
+    if manifest is not None and not (UPDATE or REVALIDATE):
+        if all(os.path.exists(f"cache/{root}{source['file']}") for source in manifest['sources']):
+            return manifest['sources'], lambda source: load_cache(f"cache/{root}{source['file']}"), True
+        log.info(f"Cached {root} data is incomplete, rebuilding")
+        manifest = None
+    known = {s['hash'] for s in manifest['sources']} if manifest is not None else set()
+
+    index, _ = get_revalidated(f'{root}index.json', f'cache/{root}index.json')
+    sources = index_sources(index)
+
+    def load(source):
+        cache_path = f"cache/{root}{source['file']}"
+        if source['hash'] in known and not REVALIDATE and os.path.exists(cache_path):
+            return load_cache(cache_path)
+        return get_revalidated(f"{root}{source['file']}", cache_path)[0]
+
+    return sources, load, False
+
+
+def _save_manifest(root, sources):
+    with open(f'cache/{root}manifest.json', 'w') as f:
+        json.dump({'sources': sources}, f, indent=2)
+
+
+def get_indexed_data(root, root_key, workers=FETCH_WORKERS):
+    """
+    Gets and merges every file listed in a 5etools index.json.
+    Each file is cached on its own under cache/<root>, alongside a manifest of the index entries it was built from.
+    With "update", only index entries that are new or changed since the manifest was written are fetched again;
+    "revalidate" additionally sends conditional GETs for the unchanged ones.
+    :param root: The directory holding the index, e.g. "bestiary/".
+    :param root_key: The key of the entry list in each file, e.g. "monster".
+    :param workers: The maximum number of requests in flight at once.
+    :return: The merged entries, in index.json order.
+    """
+    sources, load, cached = _indexed_loader(root)
+    if cached:
         out = []
-        for src, file in index.items():
-            if '3pp' in src or 'Stream' in src:
-                log.info(f"Skipped {file}: {src}")
-                continue
-            data = get_json(f"{root}{file}")
-            out.extend(data[root_key])
-            log.info(f"  Processed {file}: {len(data[root_key])} entries")
-        with open(f'cache/{cache_name}', 'w') as f:
-            json.dump(out, f, indent=2)
+        for source in sources:
+            out.extend(load(source)[root_key])
+        log.info(f"Loaded {root_key} data from cache")
         return out
+    if FROM_SNAPSHOT:
+        return _merge_sources(root_key, sources, [load(source) for source in sources])
+
+    # executor.map yields in submission order, so the merge follows index.json no matter which fetch lands first
+    out = _merge_sources(root_key, sources, _pool_map(load, sources, workers))
+    _save_manifest(root, sources)
+    return out
+
+
+def iter_indexed_data(root, root_key, workers=FETCH_WORKERS):
+    """
+    Gets every file listed in a 5etools index.json like get_indexed_data(), but yields the entries of each file in
+    turn instead of merging them, so that only a few files are held in memory at once.
+    :returns Generator of (source, entries) - The index entry of each file (see load_indexed_source()) and its
+    entries, in index.json order.
+    """
+    sources, load, cached = _indexed_loader(root)
+    if cached or FROM_SNAPSHOT:
+        workers = 1
+    for source, data in zip(sources, _pool_imap(load, sources, workers)):
+        log.info(f"  Processed {source['file']}: {len(data[root_key])} entries")
+        yield source, data[root_key]
+    if not (cached or FROM_SNAPSHOT):
+        _save_manifest(root, sources)
+
+
+def load_indexed_source(root, root_key, source):
+    """
+    Reads the entries of one file yielded by iter_indexed_data() again, from where that got it.
+    :param source: The index entry of the file, as yielded by iter_indexed_data().
+    """
+    if FROM_SNAPSHOT:
+        return get_json(f"{root}{source['file']}")[root_key]
+    return load_cache(f"cache/{root}{source['file']}")[root_key]
+
+
+def index_sources(index):
+    """
+    :param index: A 5etools index.json, mapping sources to the files holding their entries.
+    :returns list - The index entries the datasets are built from, {'source', 'file', 'hash'} each: every one but
+    those of third-party and homebrew stream sources.
+    """
+    sources = []
+    for src, file in index.items():
+        if '3pp' in src or 'Stream' in src:
+            log.info(f"Skipped {file}: {src}")
+            continue
+        sources.append({'source': src, 'file': file, 'hash': _index_entry_hash(src, file)})
+    return sources
+
+
+def _merge_sources(root_key, sources, datas):
+    out = []
+    for source, data in zip(sources, datas):
+        out.extend(data[root_key])
+        log.info(f"  Processed {source['file']}: {len(data[root_key])} entries")
+    return out
+
+
+class OutputWriter:
+    """
+    Writes a list to out/<filename> one entry at a time, so that it never has to be in memory whole, laid out just as
+    dump() lays it out. Like dump(), writes to a temporary file that only replaces the output, moving the previous one
+    to bak/, on close().
+    As a context manager, closes on success and discards what was written on an error.
+    """
+
+    def __init__(self, filename, minify=MINIFY, ndjson=NDJSON):
+        """
+        :param minify: Whether to write compact JSON instead of indenting it. Defaults to the "minify" flag.
+        :param ndjson: Whether to write one entry per line, to <name>.ndjson instead of <name>.json. Defaults to the
+        "ndjson" flag.
+        """
+        if ndjson:
+            filename = f"{os.path.splitext(filename)[0]}.ndjson"
+        self.filename = filename
+        self.minify = minify
+        self.ndjson = ndjson
+        self.count = 0
+        self._tmp = f'out/{filename}.tmp'
+        # json.dumps() only ever writes ASCII, so with newlines left as they are, characters written are bytes written
+        self._f = open(self._tmp, 'w', newline='\n')
+        self._position = 0
+        if not ndjson:
+            self._write('[')
+
+    def _write(self, text):
+        self._f.write(text)
+        self._position += len(text)
+
+    def write(self, entry):
+        """:returns (offset, length) - Where the JSON of the entry is in the file, in bytes."""
+        if self.ndjson:
+            text = json.dumps(entry, separators=(',', ':')) if self.minify else json.dumps(entry)
+        elif self.minify:
+            self._write(',' if self.count else '')
+            text = json.dumps(entry, separators=(',', ':'))
+        else:
+            # laid out exactly as json.dump(data, f, indent=2) would
+            self._write(',\n  ' if self.count else '\n  ')
+            text = json.dumps(entry, indent=2).replace('\n', '\n  ')
+        offset = self._position
+        self._write(text)
+        if self.ndjson:
+            self._write('\n')
+        self.count += 1
+        return offset, len(text)
+
+    def close(self):
+        if not self.ndjson:
+            self._write('\n]' if self.count and not self.minify else ']')
+        self._f.close()
+        try:
+            os.replace(f'out/{self.filename}', f'bak/{self.filename}.old')
+        except FileNotFoundError:
+            pass
+        os.replace(self._tmp, f'out/{self.filename}')
+
+    def discard(self):
+        self._f.close()
+        os.remove(self._tmp)
 
+    def __enter__(self):
+        return self
 
-def dump(data, filename):
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def dump(data, filename, minify=MINIFY):
+    """
+    Writes data to out/<filename>, moving the previous output to bak/.
+    Entries are streamed to a temporary file that only replaces the output once it is complete, so a crash never
+    leaves a half-written file in out/.
+    :param minify: Whether to write compact JSON instead of indenting it. Defaults to the "minify" flag.
+    """
+    if isinstance(data, list):
+        with OutputWriter(filename, minify, ndjson=False) as out:
+            for entry in data:
+                out.write(entry)
+        return
+
+    tmp = f'out/{filename}.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            if minify:
+                json.dump(data, f, separators=(',', ':'))
+            else:
+                json.dump(data, f, indent=2)
+    except BaseException:
+        os.remove(tmp)
+        raise
     try:
-        os.rename(f'out/{filename}', f'bak/{filename}.old')
+        os.replace(f'out/{filename}', f'bak/{filename}.old')
     except FileNotFoundError:
         pass
-    with open(f'out/{filename}', 'w') as f:
-        json.dump(data, f, indent=2)
+    os.replace(tmp, f'out/{filename}')
+
+
+class Spill:
+    """
+    Entries set aside in a temporary file instead of in memory, for output that can only be written once every entry
+    has been seen, e.g. in another order. add() returns a small handle, which get() reads a copy of the entry back with.
+    """
+
+    def __init__(self):
+        self._f = tempfile.TemporaryFile()
+        self._end = 0
+
+    def add(self, entry):
+        """:returns tuple - The handle of the entry."""
+        blob = marshal.dumps(entry)
+        self._f.seek(self._end)
+        self._f.write(blob)
+        handle = (self._end, len(blob))
+        self._end += len(blob)
+        return handle
+
+    def get(self, handle):
+        offset, length = handle
+        self._f.seek(offset)
+        return marshal.loads(self._f.read(length))
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_output(path):
+    """:returns The JSON in a file, or the entries of an NDJSON one."""
+    with open(path) as f:
+        if '.ndjson' in path:
+            return [json.loads(line) for line in f]
+        return json.load(f)
 
 
 def diff(filename):
+    """
+    Compares out/<filename> with the previous output in bak/, entity by entity.
+    Prints a readable summary and writes the full changelog to bak/<filename>.changelog.json.
+    """
     try:
-        with open(f'bak/{filename}.old') as before:
-            old = before.readlines()
-        with open(f'out/{filename}') as after:
-            new = after.readlines()
+        old = load_output(f'bak/{filename}.old')
+        new = load_output(f'out/{filename}')
     except FileNotFoundError:
         return
-    sys.stdout.writelines(difflib.unified_diff(old, new, fromfile=f"bak/{filename}.old", tofile=f"out/{filename}"))
+    changelog = structural_diff(old, new)
+    sys.stdout.write(format_changelog(changelog, filename))
+    with open(f'bak/{filename}.changelog.json', 'w') as f:
+        json.dump(changelog, f, indent=2)
 
 
 def nth_repl(s, sub, repl, nth):
@@ -97,39 +559,76 @@ def nth_repl(s, sub, repl, nth):
     return s
 
 
-def explicit_sources(data, sources):
+def resolve_conflicts(data, source_hierarchy=None, remove_dupes=False, explicit=(), ignored=()):
+    """
+    Resolves source conflicts in a single sweep over the data.
+    Entries from ignored sources are dropped, entries from explicit sources get their source appended to their name,
+    and then every set of entries sharing a name keeps the one whose source ranks highest in source_hierarchy;
+    the others are renamed to "Name (SOURCE)", or removed if remove_dupes is set.
+    :param source_hierarchy: Source substrings, most preferred first and ending with 'nil'. None skips duplicates.
+    :returns tuple - The resolved data, and a report of every decision as a list of dicts with keys
+                     action ("rename", "remove" or "ignore"), reason, name, source and, for renames, new_name.
+    """
+    report = []
+    kept = []
+    by_name = {}
     for entry in data:
-        if entry['source'] in sources:
+        if entry['source'] in ignored:
+            log.debug(f"{entry['name']} ({entry['source']}) ignored, removing!")
+            report.append({'action': 'ignore', 'reason': 'ignored source', 'name': entry['name'],
+                           'source': entry['source']})
+            continue
+        if entry['source'] in explicit:
             new_name = f"{entry['name']} ({entry['source']})"
-            log.info(f"Renaming {entry['name']} to {new_name} (explicit override)")
+            log.debug(f"Renaming {entry['name']} to {new_name} (explicit override)")
+            report.append({'action': 'rename', 'reason': 'explicit source', 'name': entry['name'],
+                           'source': entry['source'], 'new_name': new_name})
             entry['name'] = new_name
-    return data
+        kept.append(entry)
+        by_name.setdefault(entry['name'], []).append(entry)
+
+    if source_hierarchy is None:
+        return kept, report
+
+    ranks = {}
+
+    def rank(entry):
+        source = entry['source']
+        if source not in ranks:
+            ranks[source] = source_hierarchy.index(next((s for s in source_hierarchy if s in source), 'nil'))
+        return ranks[source]
+
+    removed = set()
+    for name, entries in by_name.items():
+        if len(entries) < 2:
+            continue
+        log.warning(f"Found duplicate: {name}")
+        for r in sorted(entries, key=rank)[1:]:
+            if not remove_dupes:
+                new_name = f"{r['name']} ({r['source']})"
+                log.debug(f"Renaming {r['name']} to {new_name}")
+                report.append({'action': 'rename', 'reason': 'duplicate', 'name': r['name'], 'source': r['source'],
+                               'new_name': new_name})
+                r['name'] = new_name
+            else:
+                log.debug(f"Removing {r['name']} ({r['source']})")
+                report.append({'action': 'remove', 'reason': 'duplicate', 'name': r['name'], 'source': r['source']})
+                removed.add(id(r))
+    if removed:
+        kept = [entry for entry in kept if id(entry) not in removed]
+    return kept, report
+
+
+def explicit_sources(data, sources):
+    return resolve_conflicts(data, explicit=sources)[0]
 
 
 def fix_dupes(data, source_hierarchy, remove_dupes=False):
-    for entry in data.copy():
-        if len([r for r in data if r['name'] == entry['name']]) > 1:
-            log.warning(f"Found duplicate: {entry['name']}")
-            hierarchied = sorted([r for r in data if r['name'] == entry['name']],
-                                 key=lambda r: source_hierarchy.index(
-                                     next((s for s in source_hierarchy if s in r['source']), 'nil')))
-            for r in hierarchied[1:]:
-                if not remove_dupes:
-                    new_name = f"{r['name']} ({r['source']})"
-                    log.info(f"Renaming {r['name']} to {new_name}")
-                    r['name'] = new_name
-                else:
-                    log.info(f"Removing {r['name']} ({r['source']})")
-                    data.remove(r)
-    return data
+    return resolve_conflicts(data, source_hierarchy, remove_dupes)[0]
 
 
 def remove_ignored(data, ignored_sources):
-    for entry in data.copy():
-        if entry['source'] in ignored_sources:
-            data.remove(entry)
-            log.info(f"{entry['name']} ({entry['source']}) ignored, removing!")
-    return data
+    return resolve_conflicts(data, ignored=ignored_sources)[0]
 
 
 def english_join(l):
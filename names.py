@@ -1,6 +1,7 @@
 import logging
 
-from lib.utils import get_data, dump
+from lib.progress import progress
+from lib.utils import get_data, dump, setup_logging
 
 log = logging.getLogger("names")
 
@@ -10,11 +11,11 @@ def get_names():
 
 
 def clean_tables(names):
-    for race in names:
-        log.info(f"Parsing names for {race['race']}")
+    for race in progress(names, "Parsing names"):
+        log.debug(f"Parsing names for {race['race']}")
         tables = []
         for table in race['tables']:
-            log.info(f"Parsing option {table['option']}")
+            log.debug(f"Parsing option {table['option']}")
             new_table = {'name': table['option'], 'choices': []}
             for choice in table['table']:
                 new_table['choices'].append(choice['enc'])
@@ -31,4 +32,5 @@ def run():
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()
@@ -1,7 +1,8 @@
 import copy
 import logging
 
-from lib.utils import diff, dump, explicit_sources, fix_dupes, get_data, remove_ignored, srdonly
+from lib.progress import progress
+from lib.utils import diff, dump, get_data, resolve_conflicts, setup_logging, srdonly
 
 SRD = ('Dragonborn', 'Half-Elf', 'Half-Orc', 'Elf (High)', 'Dwarf (Hill)', 'Human', 'Human (Variant)',
        'Halfling (Lightfoot)', 'Gnome (Rock)', 'Tiefling')
@@ -18,15 +19,15 @@ def get_races_from_web():
 
 def split_subraces(races):
     out = []
-    for race in races:
-        log.info(f"Processing race {race['name']}")
+    for race in progress(races, "Splitting subraces"):
+        log.debug(f"Processing race {race['name']}")
         if 'subraces' not in race:
             out.append(race)
         else:
             subraces = race['subraces']
             del race['subraces']
             for subrace in subraces:
-                log.info(f"Processing subrace {subrace.get('name')}")
+                log.debug(f"Processing subrace {subrace.get('name')}")
                 new = copy.deepcopy(race)
                 if 'name' in subrace:
                     new['name'] = f"{race['name']} ({subrace['name']})"
@@ -57,9 +58,8 @@ def srdfilter(data):
 def run():
     data = get_races_from_web()
     data = split_subraces(data)
-    data = explicit_sources(data, EXPLICIT_SOURCES)
-    data = fix_dupes(data, SOURCE_HIERARCHY)
-    data = remove_ignored(data, IGNORED_SOURCES)
+    data, report = resolve_conflicts(data, SOURCE_HIERARCHY, explicit=EXPLICIT_SOURCES, ignored=IGNORED_SOURCES)
+    log.info(f"Resolved {len(report)} source conflicts")
     data = srdfilter(data)
     dump(data, 'races.json')
     dump(srdonly(data), 'srd-races.json')
@@ -67,4 +67,5 @@ def run():
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()
@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+import zipfile
+from itertools import chain
+
+from lib.utils import DATA_FILES, FETCH_WORKERS, INDEXED_DATA, get_json, index_sources, iter_many_json, local_path, \
+    setup_logging
+
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT", "snapshot.zip")
+
+log = logging.getLogger("snapshot")
+
+
+def get_snapshot_paths():
+    """
+    :returns tuple - Every path the builds read but the indexes: the flat files, and the files of each index that are
+    used. Then each index, by path, as fetched to list those.
+    """
+    paths = list(DATA_FILES)
+    indexes = {}
+    for root in INDEXED_DATA:
+        indexes[f'{root}index.json'] = index = get_json(f'{root}index.json')
+        paths.extend(f"{root}{source['file']}" for source in index_sources(index))
+    return paths, indexes
+
+
+def write_snapshot(paths, filename, fetched=None):
+    """
+    Downloads every path into one compressed archive, so that DATA_SRC can point at it for offline builds.
+    Each file is written as it arrives, so that only a few are held in memory at once.
+    :param fetched: Files already fetched, by path, to write as they are instead of downloading them again.
+    """
+    fetched = fetched or {}
+    tmp = f"{filename}.tmp"
+    with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, data in chain(fetched.items(), zip(paths, iter_many_json(paths, FETCH_WORKERS))):
+            archive.writestr(local_path(path), json.dumps(data, separators=(',', ':')))
+    os.replace(tmp, filename)
+    log.info(f"Wrote {len(fetched) + len(paths)} files to {filename}")
+
+
+def run():
+    paths, indexes = get_snapshot_paths()
+    write_snapshot(paths, SNAPSHOT_PATH, indexes)
+
+
+if __name__ == '__main__':
+    setup_logging()
+    run()
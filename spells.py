@@ -1,32 +1,81 @@
-import copy
 import json
 import logging
 import sys
+from collections import Counter
 
-import requests
-
+from lib.metrics import metrics
 from lib.parsing import recursive_tag, render
-from lib.utils import diff, dump, get_indexed_data, srdonly
+from lib.progress import Progress, progress
+from lib.srd import get_srd
+from lib.utils import OutputWriter, SPELL_AUTOMATION_SRC, STREAM, Spill, diff, dump, get_data, get_indexed_data, \
+    iter_indexed_data, setup_logging, srdonly
 
 NEW_AUTOMATION = "oldauto" not in sys.argv
 VERB_TRANSFORM = {'dispel': 'dispelled', 'discharge': 'discharged'}
-SPELL_AUTOMATION_SRC = "https://raw.githubusercontent.com/avrae/avrae-spells/master/spells.json"
 IGNORED_FILES = ('3pp', 'stream')
 
 log = logging.getLogger("spells")
 
-if not NEW_AUTOMATION:
-    with open('in/auto_spells.json') as f:
-        auto_spells = json.load(f)
-else:
-    auto_spells = requests.get(SPELL_AUTOMATION_SRC).json()
+_automation = None
+
+
+class Automation:
+    """
+    The automation of each spell, by name. Remembers which spells had none and which automation was used, so that
+    both can be reported once every spell is parsed.
+    """
 
-with open('srd/srd-spells.txt') as f:
-    srd_spells = [s.strip().lower() for s in f.read().split('\n')]
+    def __init__(self, auto_spells):
+        """:param auto_spells: The automation, as a list of dicts with a name. The first of each name is used."""
+        self.by_name = {}
+        for auto_spell in auto_spells:
+            self.by_name.setdefault(auto_spell['name'], auto_spell)
+        self.used = set()
+        self.missing = set()
+
+    def get(self, name):
+        """:returns dict - The automation of the spell with the name, or None."""
+        auto_spell = self.by_name.get(name)
+        if auto_spell is None:
+            self.missing.add(name)
+        else:
+            self.used.add(name)
+        return auto_spell
+
+    def report(self):
+        """Warns about the spells that had no automation, and the automation that matched no spell."""
+        orphaned = sorted(self.by_name.keys() - self.used)
+        log.info(f"Found automation for {len(self.used)} spells")
+        if self.missing:
+            log.warning(f"No automation found for {len(self.missing)} spells: {', '.join(sorted(self.missing))}")
+        if orphaned:
+            log.warning(f"{len(orphaned)} automations matched no spell: {', '.join(orphaned)}")
+
+
+def get_auto_spells():
+    """
+    :returns Automation - The automation, fetched (or read from in/auto_spells.json with "oldauto") on first use and
+    then kept for the process.
+    """
+    global _automation
+    if _automation is None:
+        if NEW_AUTOMATION:
+            auto_spells = get_data(SPELL_AUTOMATION_SRC)
+        else:
+            with open('in/auto_spells.json') as f:
+                auto_spells = json.load(f)
+        _automation = Automation(auto_spells)
+    return _automation
+
+
+def set_auto_spells(auto_spells):
+    """Uses the given automation instead of fetching it, e.g. to parse spells offline."""
+    global _automation
+    _automation = Automation(auto_spells)
 
 
 def get_spells():
-    return get_indexed_data('spells/', 'spells.json', 'spell')
+    return get_indexed_data('spells/', 'spell')
 
 
 def parsetime(spell):
@@ -142,19 +191,17 @@ def parseclasses(spell):
 
 
 def get_automation(spell):
-    try:
-        auto_spell = next(s for s in auto_spells if s['name'] == spell['name'])
-    except StopIteration:
-        log.warning("No new automation found!")
+    auto_spell = get_auto_spells().get(spell['name'])
+    if auto_spell is None:
+        log.debug("No new automation found!")
         return None
     log.debug(f"Found new automation!")
     return auto_spell['automation']
 
 
 def get_automation_from_old(spell):
-    try:
-        auto_spell = next(s for s in auto_spells if s['name'] == spell['name'])
-    except StopIteration:
+    auto_spell = get_auto_spells().get(spell['name'])
+    if auto_spell is None:
         log.debug("No old automation found.")
         return None
 
@@ -315,71 +362,83 @@ def ensure_ml_order(spells, srd=False):
 
 def parse(data):
     processed = []
-    for spell in data:
-        log.info(f"Parsing {spell['name']}...")
-        parsetime(spell)
-        parserange(spell)
-        parsecomponents(spell)
-        parseduration(spell)
-        parseclasses(spell)
-
-        ritual = spell.get('meta', {}).get('ritual', False)
-        desc = render(spell['entries'])
-        if 'entriesHigherLevel' in spell:
-            higherlevels = render(spell['entriesHigherLevel']) \
-                .replace("**At Higher Levels**: ", "")
-        else:
-            higherlevels = None
-
-        if NEW_AUTOMATION:
-            automation = get_automation(spell)
-        else:
-            automation = get_automation_from_old(spell)
-
-        newspell = {
-            "name": spell['name'],
-            "level": spell['level'],
-            "school": spell['school'],
-            "casttime": spell['time'],
-            "range": spell['range'],
-            "components": spell['components'],
-            "duration": spell['duration'],
-            "description": desc,
-            "classes": spell['classes'],
-            "subclasses": spell['subclasses'],
-            "ritual": ritual,
-            "higherlevels": higherlevels,
-            "source": spell['source'],
-            "page": spell.get('page', '?'),
-            "concentration": spell['concentration'],
-            "automation": automation,
-        }
-        processed.append(recursive_tag(newspell))
+    tag_stats = Counter()
+    for spell in progress(data, "Parsing spells"):
+        processed.append(parse_spell(spell, tag_stats))
+    log.info(f"Rendered leftover tags in {tag_stats['changed']} strings")
+    get_auto_spells().report()
 
     processed = ensure_ml_order(processed)
     return processed
 
 
+def parse_spell(spell, tag_stats):
+    """:returns dict - The spell as it is output, but for its SRD flag."""
+    log.debug(f"Parsing {spell['name']}...")
+    parsetime(spell)
+    parserange(spell)
+    parsecomponents(spell)
+    parseduration(spell)
+    parseclasses(spell)
+
+    ritual = spell.get('meta', {}).get('ritual', False)
+    with metrics.timer('spells.render', spell['name']):
+        desc = render(spell['entries'])
+    if 'entriesHigherLevel' in spell:
+        higherlevels = render(spell['entriesHigherLevel']) \
+            .replace("**At Higher Levels**: ", "")
+    else:
+        higherlevels = None
+
+    if NEW_AUTOMATION:
+        automation = get_automation(spell)
+    else:
+        automation = get_automation_from_old(spell)
+
+    newspell = {
+        "name": spell['name'],
+        "level": spell['level'],
+        "school": spell['school'],
+        "casttime": spell['time'],
+        "range": spell['range'],
+        "components": spell['components'],
+        "duration": spell['duration'],
+        "description": desc,
+        "classes": spell['classes'],
+        "subclasses": spell['subclasses'],
+        "ritual": ritual,
+        "higherlevels": higherlevels,
+        "source": spell['source'],
+        "page": spell.get('page', '?'),
+        "concentration": spell['concentration'],
+        "automation": automation,
+    }
+    return recursive_tag(newspell, tag_stats)
+
+
 def get_auto_only(data):
-    return [{
+    return [auto_only(spell) for spell in data]
+
+
+def auto_only(spell):
+    return {
         "name": spell['name'],
         "automation": spell['automation']
-    } for spell in data]
+    }
 
 
 def site_parse(data):
-    out = []
-    for spell in data:
-        if not spell['srd']:
-            continue
-        spell['classes'] = ', '.join(spell['classes'])
-        spell['subclasses'] = ', '.join(spell['subclasses'])
-        spell['components'] = site_parse_components(spell['components'])
-        if spell['duration'].startswith("Concentration, up to "):
-            spell['duration'] = spell['duration'][len("Concentration, up to "):]
-        del spell['srd'], spell['source'], spell['page']
-        out.append(spell)
-    return out
+    return [site_parse_spell(spell) for spell in data if spell['srd']]
+
+
+def site_parse_spell(spell):
+    spell['classes'] = ', '.join(spell['classes'])
+    spell['subclasses'] = ', '.join(spell['subclasses'])
+    spell['components'] = site_parse_components(spell['components'])
+    if spell['duration'].startswith("Concentration, up to "):
+        spell['duration'] = spell['duration'][len("Concentration, up to "):]
+    del spell['srd'], spell['source'], spell['page']
+    return spell
 
 
 def site_parse_components(components):
@@ -396,37 +455,66 @@ def site_parse_components(components):
 
 
 def srdfilter(data):
-    transforms = {}
-    with open('srd/srd-spells.txt') as f:
-        for srdspell in f.read().split('\n'):
-            if ':' in srdspell:
-                old, new = srdspell.split(':')
-            else:
-                old = new = srdspell
-            transforms[old.lower().strip()] = new.lower().strip()
-    found = set()
-
+    srd = get_srd('spells')
     for spell in data:
-        spell_name = spell['name'].lower()
-        if spell_name in transforms:
-            if transforms[spell_name] == spell_name:
-                spell['srd'] = True
-                found.add(spell['name'].lower())
-            else:
-                new_spell = copy.deepcopy(spell)
-                new_spell['name'] = transforms[spell_name].title()
-                transforms[transforms[spell_name]] = transforms[spell_name]  # make sure we grab it
-                data.append(new_spell)
-                spell['srd'] = False
-        else:
+        renamed = srd.renamed(spell)
+        if renamed is not None:
+            data.append(renamed)
             spell['srd'] = False
-
-    not_found = [s for s in transforms.values() if s not in found]
-    log.warning(f"These SRD spells were not found: {', '.join(not_found)}")
+        else:
+            spell['srd'] = srd.match(spell['name'])
+    srd.report()
     return data
 
 
+def build_streaming():
+    """
+    Builds the spells as they are read. The outputs are sorted, so each spell is set aside in a Spill once it is
+    parsed, leaving only a stand-in with its name in memory, and the outputs are written from there a spell at a time.
+    They are the same as those of a normal run, or NDJSON with the "ndjson" flag.
+    :returns str - The file the SRD spells were written to.
+    """
+    tag_stats = Counter()
+    reporter = Progress("Parsing spells", None)
+    with Spill() as spill:
+        stubs = []
+        for _, spells in iter_indexed_data('spells/', 'spell'):
+            for spell in spells:
+                spell = parse_spell(spell, tag_stats)
+                stubs.append({'name': spell['name'], 'handle': spill.add(spell)})
+                reporter.update()
+        reporter.done()
+        log.info(f"Rendered leftover tags in {tag_stats['changed']} strings")
+        get_auto_spells().report()
+        # ordering and the SRD filter only need the names, and copy the stand-ins of renamed spells
+        stubs = srdfilter(ensure_ml_order(stubs))
+
+        def load(stub):
+            spell = spill.get(stub['handle'])
+            spell['name'] = stub['name']
+            spell['srd'] = stub['srd']
+            return spell
+
+        with OutputWriter('spells.json') as out, OutputWriter('spellauto.json') as auto_out, \
+                OutputWriter('template-spells.json') as site_out:
+            for stub in stubs:
+                spell = load(stub)
+                out.write(spell)
+                auto_out.write(auto_only(spell))
+                if spell['srd']:
+                    site_out.write(site_parse_spell(spell))
+        with OutputWriter('srd-spells.json') as srd_out:
+            for stub in ensure_ml_order(srdonly(stubs), True):
+                srd_out.write(load(stub))
+    return srd_out.filename
+
+
 def run():
+    if STREAM:
+        diff(build_streaming())
+        metrics.dump('spells')
+        return
+
     data = get_spells()
     processed = parse(data)
     processed = srdfilter(processed)
@@ -439,7 +527,9 @@ def run():
 
     site_templates = site_parse(processed)
     dump(site_templates, 'template-spells.json')
+    metrics.dump('spells')
 
 
 if __name__ == '__main__':
+    setup_logging()
     run()